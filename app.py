@@ -1,16 +1,25 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash
+from flask import Flask, Response, render_template, request, jsonify, redirect, url_for, flash, stream_with_context
 from config import Config
 from models import db, Simulation
-import joblib
-import requests
-from sqlalchemy import func, text
-from urllib.parse import urljoin
+from features import decisions, encode_features, score_applications
+from cache import TTLCache
+from model_registry import ModelRegistry
+from kpis import bump_kpis, ensure_kpis, read_kpis
+from cins import ensure_cins, remember_cins
+from ingest import add_id_range, iter_csv_chunks, insert_staging_chunk, MAX_REJECTED_SAMPLES
+from dispatcher import create_dispatcher
+from metrics import Metrics, system_usage
+from export import iter_csv, iter_parquet, iter_row_batches
+from progress import ProgressFeed
+from microbatch import BatchTimeout, create_micro_batcher
+from writebehind import WriteBehindFull, create_write_behind
+from sqlalchemy import func, insert, or_, text, tuple_
 import numpy as np
 import os
 import random
 from datetime import datetime, timedelta
-import csv
-from io import StringIO
+import json
+import base64
 from sqlalchemy import func
 
 app = Flask(__name__)
@@ -19,37 +28,55 @@ app.config.from_object(Config)
 
 db.init_app(app)
 
+# Per-endpoint / per-stage latency and DB query counts (/metrics, /api/metrics)
+metrics = Metrics(app.config['METRICS_DIR'])
+metrics.init_app(app)
+
 
 AIRFLOW_HOST = os.environ.get('AIRFLOW_HOST', 'http://localhost:8080')
 AIRFLOW_USER = os.environ.get('AIRFLOW_USER', 'admin')
 AIRFLOW_PASS = os.environ.get('AIRFLOW_PASS', 'admin')
 
+# Triggers are coalesced and posted from a background thread
+dag_dispatcher = create_dispatcher(AIRFLOW_HOST, (AIRFLOW_USER, AIRFLOW_PASS),
+                                   window=app.config['AIRFLOW_TRIGGER_WINDOW'],
+                                   retries=app.config['AIRFLOW_TRIGGER_RETRIES'],
+                                   backoff=app.config['AIRFLOW_TRIGGER_BACKOFF'],
+                                   timeout=app.config['AIRFLOW_TRIGGER_TIMEOUT'])
+
 def trigger_airflow_dag(dag_id='daily_loan_batch_processing', conf=None):
-    """Trigger an Airflow DAG run via REST API (best-effort)."""
+    """Queue an Airflow DAG run (best-effort); returns without waiting for Airflow."""
     try:
-        api_url = urljoin(AIRFLOW_HOST, f'/api/v1/dags/{dag_id}/dagRuns')
-        resp = requests.post(api_url, auth=(AIRFLOW_USER, AIRFLOW_PASS), json={'conf': conf or {}} , timeout=10)
-        if resp.status_code in (200, 201):
-            return True, resp.json()
-        return False, resp.text
+        return True, dag_dispatcher.submit(dag_id, conf)
     except Exception as e:
         return False, str(e)
 
 
-model = None
-scaler = None
-try:
-    model_path = os.path.join(app.config['BASE_DIR'], 'loan_prediction_model.pkl')
-    scaler_path = os.path.join(app.config['BASE_DIR'], 'data_scaler.pkl')
-    model = joblib.load(model_path)
-    scaler = joblib.load(scaler_path)
-    with app.app_context():
-        db.create_all()
-    app.logger.info("✅ NB BANK: System Ready & AI Models Loaded")
-except Exception as e:
-    model = None
-    scaler = None
-    app.logger.error(f"❌ ML model load failed: {e}")
+model_path = os.path.join(app.config['BASE_DIR'], 'loan_prediction_model.pkl')
+scaler_path = os.path.join(app.config['BASE_DIR'], 'data_scaler.pkl')
+
+# Loaded on first use and hot-swapped when the files on disk change
+model_registry = ModelRegistry(model_path, scaler_path,
+                               metrics_path=os.path.join(app.config['BASE_DIR'], 'model_metrics.json'),
+                               interval=app.config['MODEL_RELOAD_INTERVAL'])
+
+# Repeated simulations skip the model; keys include the model version
+prediction_cache = TTLCache(app.config['PREDICTION_CACHE_SIZE'], app.config['PREDICTION_CACHE_TTL'])
+_cached_version = None
+
+with app.app_context():
+    db.create_all()
+    ensure_kpis()
+    ensure_cins()
+    # Batch DAG progress, pushed to /api/pipeline/stream (one listener per process)
+    progress_feed = ProgressFeed(db.engine, poll_interval=app.config['PROGRESS_POLL_INTERVAL'])
+
+if not app.config['MODEL_PRELOAD']:
+    app.logger.info("✅ NB BANK: System Ready (models load on first prediction)")
+elif model_registry.get() is not None:
+    app.logger.info(f"✅ NB BANK: System Ready & AI Model {model_registry.version} Loaded")
+else:
+    app.logger.error(f"❌ ML model load failed: {model_registry.last_error}")
 
 
 
@@ -68,13 +95,15 @@ def login():
 
 @app.route('/dashboard')
 def dashboard():
-    total_clients = Simulation.query.count()
-    high_risk_count = Simulation.query.filter(Simulation.risk_score > 50).count()
+    kpis = read_kpis()
+    total_clients = kpis.total_clients
+    high_risk_count = kpis.high_risk_count
     
-    total_volume = db.session.query(func.sum(Simulation.loan_amount)).scalar() or 0
+    total_volume = kpis.total_volume or 0
     total_volume_millions = total_volume / 1000000
     
-    accuracy = 91.2
+    artifacts = model_registry.get()
+    accuracy = artifacts.accuracy if artifacts is not None else None
     recent_sims = Simulation.query.order_by(Simulation.date_added.desc()).limit(5).all()
     
     return render_template('dashboard.html', 
@@ -90,7 +119,7 @@ def simulation():
 
 @app.route('/pipeline')
 def pipeline():
-    total_processed = Simulation.query.count()
+    total_processed = read_kpis().total_clients
     
     try:
         res = db.session.execute(text("SELECT COUNT(*) FROM staging_applications WHERE processed = FALSE"))
@@ -112,72 +141,145 @@ def pipeline():
                          total_processed=total_processed,
                          staging_count=staging_count,
                          recent_batches=recent_batches,
-                         recent_staging=recent_staging)
+                         recent_staging=recent_staging,
+                         dispatch=dag_dispatcher.state(),
+                         progress_runs=progress_feed.snapshot(),
+                         predict_latency=metrics.summary().get('predict', {}).get('avg_ms'))
+
+@app.route('/api/dispatch_status')
+def dispatch_status():
+    return jsonify(dag_dispatcher.state())
+
+@app.route('/api/pipeline/progress')
+def pipeline_progress():
+    """Recent batch runs from the in-process feed (no query per call)"""
+    return jsonify({'runs': progress_feed.snapshot()})
+
+@app.route('/api/pipeline/stream')
+def pipeline_stream():
+    """Server-Sent Events: a snapshot of recent runs, then every change as it happens"""
+    subscriber = progress_feed.subscribe(app.config['SSE_MAX_STREAMS'])
+    if subscriber is None:
+        return jsonify({'error': 'Too many open progress streams; poll /api/pipeline/progress'}), 503
+    events = progress_feed.events(subscriber, app.config['SSE_STREAM_SECONDS'])
+    return Response(events, mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def _trigger_staged(id_ranges):
+    """Hand committed staging rows to the batch DAG: (triggered, info)"""
+    if not id_ranges:
+        return False, 'No rows inserted'
+    try:
+        with metrics.stage('dag_trigger'):
+            return trigger_airflow_dag(conf={'staging_id_ranges': id_ranges})
+    except Exception as e:
+        return False, str(e)
+
+
+def _stream_batch_ingest(file):
+    """Yield one NDJSON progress line per committed chunk, then a summary line."""
+    chunk_size = app.config['INGEST_CHUNK_SIZE']
+    inserted = 0
+    rejected_total = 0
+    rejected_samples = []
+    id_ranges = []
+    chunk_no = 0
+    committed_chunks = 0
+
+    try:
+        chunks = iter_csv_chunks(file.stream, chunk_size)
+        while True:
+            with metrics.stage('parse'):
+                chunk = next(chunks, None)
+            if chunk is None:
+                break
+            rows, rejected = chunk
+            chunk_no += 1
+            with metrics.stage('insert'):
+                ids = insert_staging_chunk(db.session, rows)
+                db.session.commit()
+            committed_chunks += 1
+
+            inserted += len(ids)
+            rejected_total += len(rejected)
+            add_id_range(id_ranges, ids)
+            for line, error in rejected:
+                if len(rejected_samples) < MAX_REJECTED_SAMPLES:
+                    rejected_samples.append({'line': line, 'error': error})
+
+            yield json.dumps({'chunk': chunk_no, 'inserted': len(ids), 'rejected': len(rejected),
+                              'total_inserted': inserted}) + '\n'
+    except Exception as e:
+        db.session.rollback()
+        # The chunks committed so far are staged; process them anyway
+        ok, info = _trigger_staged(id_ranges)
+        yield json.dumps({'success': False, 'error': str(e), 'chunks_committed': committed_chunks,
+                          'inserted': inserted, 'staging_id_ranges': id_ranges,
+                          'dag_triggered': ok, 'dag_info': info}) + '\n'
+        return
+
+    ok, info = _trigger_staged(id_ranges)
+    yield json.dumps({'success': True, 'chunks': chunk_no, 'inserted': inserted,
+                      'rejected': rejected_total, 'rejected_samples': rejected_samples,
+                      'staging_id_ranges': id_ranges, 'dag_triggered': ok, 'dag_info': info}) + '\n'
 
 
 @app.route('/batch_process', methods=['POST'])
 def batch_process():
-    if 'file' not in request.files:
+    """
+    Stage an uploaded CSV, committing it chunk by chunk. Default mode
+    answers once with a summary and stops at the first malformed row
+    (400); ?mode=stream skips malformed rows and reports every chunk.
+    Either way the chunks committed before a failure go to the batch DAG.
+    """
+    # Multipart decoding of the upload happens on first access
+    with metrics.stage('decode'):
+        files = request.files
+    if 'file' not in files:
         return jsonify({'success': False, 'error': 'No file uploaded'}), 400
     
-    file = request.files['file']
+    file = files['file']
     if file.filename == '' or not file.filename.endswith('.csv'):
         return jsonify({'success': False, 'error': 'Invalid file format'}), 400
+
+    if (request.args.get('mode') or request.form.get('mode')) == 'stream':
+        return Response(stream_with_context(_stream_batch_ingest(file)), mimetype='application/x-ndjson')
     
+    inserted = 0
+    id_ranges = []
+    error, status = None, 200
     try:
-        stream = StringIO(file.stream.read().decode("UTF8"), newline=None)
-        csv_data = csv.DictReader(stream)
-        inserted = 0
-        staging_ids = []
-
-        for row in csv_data:
-            
-            sql = text("""
-                INSERT INTO staging_applications
-                (client_name, cin, phone, annual_income, debt_to_income_ratio, credit_score,
-                 loan_amount, loan_term, interest_rate, gender, marital_status, education_level,
-                 employment_status, loan_purpose, processed, uploaded_at)
-                VALUES (:client_name, :cin, :phone, :annual_income, :dti, :credit_score,
-                        :loan_amount, :loan_term, :interest_rate, :gender, :marital_status,
-                        :education_level, :employment_status, :loan_purpose, FALSE, NOW())
-                RETURNING id
-            """)
-
-            params = {
-                'client_name': row.get('client_name', 'Batch Client'),
-                'cin': row.get('cin'),
-                'phone': row.get('phone'),
-                'annual_income': float(row.get('annual_income') or 0),
-                'dti': float(row.get('debt_to_income_ratio') or 0),
-                'credit_score': int(row.get('credit_score') or 0),
-                'loan_amount': float(row.get('loan_amount') or 0),
-                'loan_term': int(row.get('loan_term') or 36),
-                'interest_rate': float(row.get('interest_rate') or 5),
-                'gender': row.get('gender'),
-                'marital_status': row.get('marital_status'),
-                'education_level': row.get('education_level'),
-                'employment_status': row.get('employment_status'),
-                'loan_purpose': row.get('loan_purpose')
-            }
-
-            result = db.session.execute(sql, params)
-            new_id = result.fetchone()[0]
-            staging_ids.append(int(new_id))
-            inserted += 1
-
-        db.session.commit()
-
-        
-        try:
-            ok, info = trigger_airflow_dag(conf={'staging_ids': staging_ids})
-        except Exception as e:
-            ok, info = False, str(e)
-
-        return jsonify({'success': True, 'inserted': inserted, 'staging_ids': staging_ids, 'dag_triggered': ok, 'dag_info': info})
-
+        chunks = iter_csv_chunks(file.stream, app.config['INGEST_CHUNK_SIZE'])
+        while True:
+            with metrics.stage('parse'):
+                chunk = next(chunks, None)
+            if chunk is None:
+                break
+            rows, rejected = chunk
+            if rejected:
+                line, reason = rejected[0]
+                error, status = f"Malformed row at line {line}: {reason}", 400
+                break
+            with metrics.stage('insert'):
+                ids = insert_staging_chunk(db.session, rows)
+            with metrics.stage('commit'):
+                db.session.commit()
+            inserted += len(ids)
+            add_id_range(id_ranges, ids)
+    except UnicodeDecodeError as e:
+        db.session.rollback()
+        error, status = f"File is not valid UTF-8: {e}", 400
     except Exception as e:
         db.session.rollback()
-        return jsonify({'success': False, 'error': str(e)}), 500
+        error, status = str(e), 500
+
+    ok, info = _trigger_staged(id_ranges)
+    body = {'success': error is None, 'inserted': inserted, 'staging_id_ranges': id_ranges,
+            'dag_triggered': ok, 'dag_info': info}
+    if error is not None:
+        body['error'] = error
+    return jsonify(body), status
 
 
 
@@ -186,54 +288,60 @@ def batch_upload():
     
     return batch_process()
 
+def _lookup_cached(data, artifacts):
+    """Encode one form and look it up in the prediction cache: (features, key, result or None)."""
+    global _cached_version
+    version = artifacts.version
+    if version != _cached_version:
+        prediction_cache.clear()
+        _cached_version = version
+
+    with metrics.stage('encode'):
+        features = encode_features([data], artifacts.scorer.n_features)
+    key = (version, features.tobytes())
+    result = prediction_cache.get(key)
+    metrics.inc('nb_prediction_cache_lookups_total', result='miss' if result is None else 'hit')
+    return features, key, result
+
+def _score_cached(data, artifacts):
+    """Score one form through the prediction cache, keyed on the encoded features."""
+    scorer = artifacts.scorer
+    features, key, result = _lookup_cached(data, artifacts)
+    if result is None:
+        with metrics.stage('scale'):
+            X = scorer.prepare(features)
+        with metrics.stage('score'):
+            risk_scores, statuses = decisions(scorer.predict_prepared(X))
+        result = (float(risk_scores[0]), statuses[0])
+        prediction_cache.put(key, result)
+    return result
+
 @app.route('/predict', methods=['POST'])
 def predict():
+    artifacts = model_registry.get()
+    if artifacts is None:
+        return jsonify({'error': 'ML model or scaler not loaded on server'}), 500
     try:
-        if model is None or scaler is None:
-            return jsonify({'error': 'ML model or scaler not loaded on server'}), 500
-        data = request.form
-        model_inputs = [
-            float(data.get('annual_income', 0)),
-            float(data.get('debt_to_income_ratio', 0)),
-            float(data.get('credit_score', 0)),
-            float(data.get('loan_amount', 0)),
-            float(data.get('interest_rate', 0)),
-            1 if data.get('gender') == 'Male' else 0,
-            1 if data.get('marital_status') == 'Married' else 0,
-            1 if data.get('education_level') == 'Graduate' else 0,
-            1 if data.get('employment_status') == 'Employed' else 0,
-            1 if data.get('loan_purpose') == 'Business' else 0,
-            1, 0, 1
-        ]
-
-        features = np.array([model_inputs])
-        if scaler.n_features_in_ > len(model_inputs):
-            padding = np.zeros((1, scaler.n_features_in_ - len(model_inputs)))
-            features = np.hstack([features, padding])
-            
-        features_scaled = scaler.transform(features)
-       
-        proba_paid = model.predict_proba(features_scaled)[0][1] * 100
-        risk_of_default = round(100.0 - proba_paid, 2)
-        final_status = 'Approved' if proba_paid >= 50 else 'Rejected'
-
-        new_entry = Simulation(
-            client_name=data.get('client_name', 'Client Inconnu'),
-            cin=data.get('cin', 'N/A'),
-            phone=data.get('phone', 'N/A'),
-            annual_income=float(data.get('annual_income', 0)),
-            credit_score=int(data.get('credit_score', 0)),
-            loan_amount=float(data.get('loan_amount', 0)),
-            loan_term=int(data.get('loan_term', 0)),
-            interest_rate=float(data.get('interest_rate', 0)),
-            risk_score=float(risk_of_default),
-            status=final_status
-        )
-        
-        db.session.add(new_entry)
-        db.session.commit()
+        with metrics.stage('parse'):
+            application = _parse_application(request.form)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
 
-        reason = "Ratio d'endettement critique (>40%)" if float(data.get('debt_to_income_ratio', 0)) > 40 else "Score de crédit insuffisant"
+    try:
+        if predict_batcher is not None:
+            features, key, result = _lookup_cached(application, artifacts)
+            with metrics.stage('microbatch'):
+                risk_of_default, final_status = predict_batcher.submit(
+                    {'application': application, 'artifacts': artifacts,
+                     'features': features, 'key': key, 'result': result},
+                    timeout=app.config['PREDICT_MICROBATCH_TIMEOUT'])
+        else:
+            risk_of_default, final_status = _score_cached(application, artifacts)
+
+            with metrics.stage('db_commit' if simulation_writer is None else 'write_behind'):
+                _store_simulations([_simulation_row(application, risk_of_default, final_status)])
+
+        reason = "Ratio d'endettement critique (>40%)" if application['debt_to_income_ratio'] > 40 else "Score de crédit insuffisant"
         
         return jsonify({
             'status': final_status,
@@ -241,13 +349,332 @@ def predict():
             'reason': reason
         })
 
+    except WriteBehindFull as e:
+        return jsonify({'error': str(e)}), 503
+    except BatchTimeout:
+        return jsonify({'error': 'Scoring queue timed out; retry later'}), 503
     except Exception as e:
-        return jsonify({'error': str(e)}), 400
+        db.session.rollback()
+        app.logger.exception("Prediction failed")
+        return jsonify({'error': str(e)}), 500
+
+def _parse_application(data):
+    """Normalize one JSON application into Simulation columns (raises on bad values)."""
+    return {
+        'client_name': data.get('client_name') or 'Client Inconnu',
+        'cin': data.get('cin', 'N/A'),
+        'phone': data.get('phone', 'N/A'),
+        'annual_income': float(data.get('annual_income', 0)),
+        'debt_to_income_ratio': float(data.get('debt_to_income_ratio', 0)),
+        'credit_score': int(float(data.get('credit_score', 0))),
+        'loan_amount': float(data.get('loan_amount', 0)),
+        'loan_term': int(float(data.get('loan_term', 0))),
+        'interest_rate': float(data.get('interest_rate', 0)),
+        'gender': data.get('gender'),
+        'marital_status': data.get('marital_status'),
+        'education_level': data.get('education_level'),
+        'employment_status': data.get('employment_status'),
+        'loan_purpose': data.get('loan_purpose'),
+    }
+
+# Parsed application fields stored on Simulation
+SIMULATION_FIELDS = ('client_name', 'cin', 'phone', 'annual_income', 'credit_score',
+                     'loan_amount', 'loan_term', 'interest_rate')
+
+def _simulation_row(application, risk_score, status):
+    row = {field: application[field] for field in SIMULATION_FIELDS}
+    # Stamped when scored, not when a write-behind batch reaches the database
+    row.update(risk_score=float(risk_score), status=status, date_added=datetime.now())
+    return row
+
+def _insert_simulations(rows):
+    """Insert scored simulations (one multi-row INSERT), bump the KPIs and record the CINs in one transaction."""
+    try:
+        db.session.execute(insert(Simulation.__table__).values(rows))
+        bump_kpis([r['risk_score'] for r in rows], [r['loan_amount'] for r in rows])
+        remember_cins(r['cin'] for r in rows)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+def _store_simulations(rows):
+    """Insert now, or hand the rows to the write-behind writer (waits while its queue is full)."""
+    if simulation_writer is not None:
+        simulation_writer.put(rows, timeout=app.config['WRITE_BEHIND_PUT_TIMEOUT'])
+    else:
+        _insert_simulations(rows)
+
+def _write_behind_flush(rows):
+    with app.app_context():
+        _insert_simulations(rows)
+
+simulation_writer = None
+if app.config['PREDICT_WRITE_BEHIND']:
+    simulation_writer = create_write_behind(_write_behind_flush, app.config['WRITE_BEHIND_SPOOL_DIR'],
+                                            maxsize=app.config['WRITE_BEHIND_QUEUE_SIZE'],
+                                            batch_size=app.config['WRITE_BEHIND_BATCH_SIZE'],
+                                            interval=app.config['WRITE_BEHIND_INTERVAL_MS'] / 1000,
+                                            retry_delay=app.config['WRITE_BEHIND_RETRY_DELAY'],
+                                            datetime_fields=('date_added',),
+                                            name='simulation-writer')
+
+
+def _predict_microbatch(items):
+    """
+    Score the cache misses of one micro-batch in a single model call per
+    model version and store every row with one INSERT and one KPI update
+    (or one write-behind put). Runs on the batcher thread.
+    """
+    groups = {}
+    for item in items:
+        if item['result'] is None:
+            groups.setdefault(item['artifacts'].version, []).append(item)
+    for group in groups.values():
+        scorer = group[0]['artifacts'].scorer
+        X = scorer.prepare(np.vstack([item['features'] for item in group]))
+        risk_scores, statuses = decisions(scorer.predict_prepared(X))
+        for item, risk, status in zip(group, risk_scores, statuses):
+            item['result'] = (float(risk), status)
+            prediction_cache.put(item['key'], item['result'])
+
+    rows = [_simulation_row(item['application'], *item['result']) for item in items]
+    with app.app_context():
+        _store_simulations(rows)
+
+    metrics.observe('nb_predict_microbatch_size', len(items))
+    return [item['result'] for item in items]
+
+predict_batcher = None
+if app.config['PREDICT_MICROBATCH']:
+    predict_batcher = create_micro_batcher(_predict_microbatch,
+                                           window=app.config['PREDICT_MICROBATCH_WINDOW_MS'] / 1000,
+                                           max_size=app.config['PREDICT_MICROBATCH_MAX_SIZE'],
+                                           name='predict-batcher')
+
+
+@app.route('/predict_batch', methods=['POST'])
+def predict_batch():
+    """Score a JSON array of applications in one model call and one bulk insert."""
+    artifacts = model_registry.get()
+    if artifacts is None:
+        return jsonify({'success': False, 'error': 'ML model or scaler not loaded on server'}), 500
+    scorer = artifacts.scorer
+
+    payload = request.get_json(silent=True)
+    if isinstance(payload, dict):
+        payload = payload.get('applications')
+    if not isinstance(payload, list):
+        return jsonify({'success': False, 'error': 'Expected a JSON array of applications'}), 400
+    if len(payload) > app.config['PREDICT_BATCH_MAX']:
+        return jsonify({'success': False, 'error': f"Batch too large (max {app.config['PREDICT_BATCH_MAX']})"}), 413
+
+    results = [None] * len(payload)
+    valid_idx = []
+    applications = []
+
+    for idx, item in enumerate(payload):
+        try:
+            if not isinstance(item, dict):
+                raise ValueError('Application must be a JSON object')
+            applications.append(_parse_application(item))
+            valid_idx.append(idx)
+        except (TypeError, ValueError) as e:
+            results[idx] = {'index': idx, 'error': str(e)}
+
+    try:
+        if applications:
+            risk_scores, statuses = score_applications(scorer, applications)
+
+            rows = []
+            for idx, appl, risk, status in zip(valid_idx, applications, risk_scores, statuses):
+                reason = "Ratio d'endettement critique (>40%)" if appl['debt_to_income_ratio'] > 40 else "Score de crédit insuffisant"
+                results[idx] = {'index': idx, 'status': status, 'risk_score': float(risk), 'reason': reason}
+                row = {field: appl[field] for field in SIMULATION_FIELDS}
+                row.update(risk_score=float(risk), status=status)
+                rows.append(row)
+
+            _insert_simulations(rows)
+
+        return jsonify({
+            'success': True,
+            'total': len(payload),
+            'scored': len(applications),
+            'failed': len(payload) - len(applications),
+            'results': results
+        })
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/cache_stats')
+def cache_stats():
+    return jsonify(dict(prediction_cache.stats(), model_version=model_registry.version))
+
+@app.route('/metrics')
+def prometheus_metrics():
+    usage = system_usage(app.config['BASE_DIR'])
+    cache = prediction_cache.stats()
+    gauges = {
+        'nb_system_cpu_percent': ('1-minute load average per core, in percent', usage['cpu']),
+        'nb_system_memory_percent': ('Memory in use, in percent', usage['ram']),
+        'nb_system_storage_percent': ('Disk in use on the app volume, in percent', usage['storage']),
+        'nb_prediction_cache_entries': ('Entries in this process prediction cache', cache['size']),
+    }
+    if simulation_writer is not None:
+        writer = simulation_writer.stats()
+        gauges['nb_write_behind_pending_rows'] = ('Simulations queued in this process, not yet written', writer['pending'] + writer['in_flight'])
+        gauges['nb_write_behind_spool_pending'] = ('1 while this process has rows waiting in the spool', int(writer['spool_pending']))
+    return Response(metrics.render_prometheus(gauges), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/metrics')
+def metrics_api():
+    return jsonify({
+        'system': system_usage(app.config['BASE_DIR']),
+        'endpoints': metrics.summary(),
+        'model_version': model_registry.version,
+        'prediction_cache': prediction_cache.stats(),
+        'predict_microbatch': predict_batcher.stats() if predict_batcher is not None else None,
+        'write_behind': simulation_writer.stats() if simulation_writer is not None else None,
+    })
+
+@app.route('/model_status')
+def model_status():
+    return jsonify(model_registry.state())
+
+REQUEST_COLUMNS = (
+    Simulation.id, Simulation.client_name, Simulation.cin, Simulation.phone,
+    Simulation.annual_income, Simulation.credit_score, Simulation.loan_amount,
+    Simulation.loan_term, Simulation.interest_rate, Simulation.risk_score,
+    Simulation.status, Simulation.date_added,
+)
+
+RISK_FILTERS = {
+    'high': lambda q: q.filter(Simulation.risk_score > 50),
+    'medium': lambda q: q.filter(Simulation.risk_score > 30, Simulation.risk_score <= 50),
+    'low': lambda q: q.filter(Simulation.risk_score <= 30),
+}
+
+
+# Free-text search on /requests (case-insensitive substring)
+SEARCH_COLUMNS = (Simulation.client_name, Simulation.cin, Simulation.phone)
+
+
+def _search_filter(term):
+    """Match `term` in any SEARCH_COLUMNS; the keyset walk skips non-matching rows"""
+    escaped = term.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    pattern = f'%{escaped}%'
+    return or_(*(func.lower(col).like(pattern, escape='\\') for col in SEARCH_COLUMNS))
+
+
+def _encode_cursor(row):
+    raw = f"{row.date_added.isoformat()}|{row.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor):
+    date_added, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    return datetime.fromisoformat(date_added), int(row_id)
+
+
+def _requests_page(args):
+    """One keyset page of simulations, newest first, as (rows, next_cursor)."""
+    limit = args.get('limit', app.config['REQUESTS_PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, app.config['REQUESTS_PAGE_MAX']))
+    query = db.session.query(*REQUEST_COLUMNS)
+
+    status = args.get('status')
+    if status:
+        query = query.filter(Simulation.status == status)
+    risk = args.get('risk')
+    if risk in RISK_FILTERS:
+        query = RISK_FILTERS[risk](query)
+    search = (args.get('q') or '').strip()
+    if search:
+        query = query.filter(_search_filter(search))
+
+    cursor = args.get('cursor')
+    if cursor:
+        query = query.filter(tuple_(Simulation.date_added, Simulation.id) < _decode_cursor(cursor))
+
+    rows = query.order_by(Simulation.date_added.desc(), Simulation.id.desc()).limit(limit + 1).all()
+    next_cursor = _encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
 
 @app.route('/requests')
 def requests_list():
-    all_clients = Simulation.query.order_by(Simulation.date_added.desc()).all()
-    return render_template('requests.html', clients=all_clients)
+    try:
+        clients, next_cursor = _requests_page(request.args)
+    except ValueError:
+        return redirect(url_for('requests_list'))
+    return render_template('requests.html', clients=clients, next_cursor=next_cursor,
+                           status_filter=request.args.get('status', ''),
+                           risk_filter=request.args.get('risk', ''),
+                           search=request.args.get('q', ''))
+
+@app.route('/api/requests')
+def requests_api():
+    try:
+        rows, next_cursor = _requests_page(request.args)
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    items = [dict(row._mapping, date_added=row.date_added.isoformat()) for row in rows]
+    return jsonify({'items': items, 'next_cursor': next_cursor})
+
+def _parse_export_date(value, end=False):
+    """ISO date or datetime; a plain date given as the end of the range includes that day"""
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if end and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed
+
+
+EXPORT_FORMATS = {
+    'csv': (iter_csv, 'text/csv'),
+    'parquet': (iter_parquet, 'application/vnd.apache.parquet'),
+}
+
+
+@app.route('/api/export')
+def export_simulations():
+    """
+    Stream simulations as CSV (default) or Parquet, oldest first.
+    Filters: from / to (ISO dates, `to` inclusive), status, risk.
+    Under gunicorn sync workers (WEB_THREADS=1) a download must finish
+    within WEB_TIMEOUT; threaded workers have no such limit.
+    """
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+    try:
+        start = _parse_export_date(request.args.get('from'))
+        end = _parse_export_date(request.args.get('to'), end=True)
+    except ValueError:
+        return jsonify({'error': 'from / to must be ISO dates (YYYY-MM-DD)'}), 400
+
+    stmt = db.select(*REQUEST_COLUMNS)
+    if start:
+        stmt = stmt.where(Simulation.date_added >= start)
+    if end:
+        stmt = stmt.where(Simulation.date_added < end)
+    status = request.args.get('status')
+    if status:
+        stmt = stmt.where(Simulation.status == status)
+    risk = request.args.get('risk')
+    if risk in RISK_FILTERS:
+        stmt = RISK_FILTERS[risk](stmt)
+    stmt = stmt.order_by(Simulation.date_added, Simulation.id)
+
+    writer, mimetype = EXPORT_FORMATS[fmt]
+    columns = [column.key for column in REQUEST_COLUMNS]
+    batches = iter_row_batches(db.engine, stmt, app.config['EXPORT_BATCH_SIZE'])
+    filename = f"simulations_{datetime.now():%Y%m%d_%H%M%S}.{fmt}"
+    return Response(stream_with_context(writer(columns, batches)), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
 
 @app.route('/test_etl', methods=['POST'])
 def test_etl():
@@ -255,7 +682,7 @@ def test_etl():
     try:
         ok, info = trigger_airflow_dag(dag_id='daily_loan_batch_processing', conf={})
         if ok:
-            return jsonify({'success': True, 'message': 'ETL DAG triggered successfully', 'details': info})
+            return jsonify({'success': True, 'message': 'ETL DAG trigger queued', 'details': info})
         else:
             return jsonify({'success': False, 'error': 'Failed to trigger DAG', 'details': info}), 500
     except Exception as e:
@@ -0,0 +1,94 @@
+"""
+NB BANK - In-process LRU cache with TTL for prediction results
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire `ttl` seconds after insert"""
+
+    def __init__(self, maxsize=4096, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return the cached value or None (counts a hit or a miss)"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class FileVersion:
+    """
+    Fingerprint of a set of files (mtime + size), re-checked at most once
+    every `interval` seconds so callers can poll it on every request.
+    """
+
+    def __init__(self, paths, interval=1.0):
+        self.paths = list(paths)
+        self.interval = interval
+        self._checked_at = 0.0
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _fingerprint(self):
+        parts = []
+        for path in self.paths:
+            try:
+                st = os.stat(path)
+                parts.append(f'{st.st_mtime_ns:x}-{st.st_size:x}')
+            except OSError:
+                parts.append('missing')
+        return ':'.join(parts)
+
+    def current(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._version is None or now - self._checked_at >= self.interval:
+                self._version = self._fingerprint()
+                self._checked_at = now
+            return self._version
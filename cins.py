@@ -0,0 +1,37 @@
+"""
+NB BANK - Index of the CINs already in simulations
+simulations is partitioned by month and cin is not part of the key, so a
+lookup there probes every partition. simulation_cins keeps each CIN once
+(primary key) in an ordinary table: every insert into simulations adds its
+CINs in the same transaction, and the batch DAG deduplicates against it.
+"""
+
+from sqlalchemy import exists, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import db, Simulation, SimulationCin
+
+
+def _insert():
+    dialect = db.session.get_bind().dialect.name
+    return (pg_insert if dialect == 'postgresql' else sqlite_insert)(SimulationCin.__table__)
+
+
+def remember_cins(cins):
+    """Record the CINs of newly inserted simulations (caller commits)"""
+    # Sorted, so concurrent writers take the key locks in the same order
+    cins = sorted({cin for cin in cins if cin})
+    if not cins:
+        return
+    stmt = _insert().values([{'cin': cin} for cin in cins]).on_conflict_do_nothing()
+    db.session.execute(stmt)
+
+
+def ensure_cins():
+    """Fill simulation_cins from simulations on first start (commits)"""
+    if db.session.execute(select(exists().select_from(SimulationCin.__table__))).scalar():
+        return
+    history = select(Simulation.cin).where(Simulation.cin.isnot(None)).distinct()
+    db.session.execute(_insert().from_select(['cin'], history).on_conflict_do_nothing())
+    db.session.commit()
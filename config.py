@@ -7,4 +7,82 @@ class Config:
     
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///' + os.path.join(BASE_DIR, 'bank_data.db')
     
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Connection pool of each web worker process (see gunicorn.conf.py);
+    # Postgres must allow WEB_WORKERS * (DB_POOL_SIZE + DB_MAX_OVERFLOW)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 2))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 2))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 10))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': True,
+    }
+
+    # Production server (gunicorn.conf.py); 0 workers means one per CPU
+    WEB_WORKERS = int(os.environ.get('WEB_WORKERS', 0))
+    WEB_THREADS = int(os.environ.get('WEB_THREADS', 1))
+    WEB_TIMEOUT = int(os.environ.get('WEB_TIMEOUT', 60))
+    WEB_GRACEFUL_TIMEOUT = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 30))
+    WEB_MAX_REQUESTS = int(os.environ.get('WEB_MAX_REQUESTS', 5000))
+    # Load the model at import time (in the gunicorn master) instead of on first use
+    MODEL_PRELOAD = os.environ.get('MODEL_PRELOAD', '0') == '1'
+
+    PREDICT_BATCH_MAX = int(os.environ.get('PREDICT_BATCH_MAX', 1000))
+    INGEST_CHUNK_SIZE = int(os.environ.get('INGEST_CHUNK_SIZE', 1000))
+
+    PREDICTION_CACHE_SIZE = int(os.environ.get('PREDICTION_CACHE_SIZE', 4096))
+    PREDICTION_CACHE_TTL = int(os.environ.get('PREDICTION_CACHE_TTL', 300))
+
+    # Opt-in micro-batching of concurrent /predict calls: requests arriving
+    # within the window (or until the batch is full) share one model call
+    # and one commit. Batches only form between the threads of one worker,
+    # so gunicorn.conf.py refuses to start with it and WEB_THREADS < 2. A
+    # request whose batch takes longer than PREDICT_MICROBATCH_TIMEOUT
+    # seconds gets a 503; keep it well below WEB_TIMEOUT.
+    PREDICT_MICROBATCH = os.environ.get('PREDICT_MICROBATCH', '0') == '1'
+    PREDICT_MICROBATCH_WINDOW_MS = float(os.environ.get('PREDICT_MICROBATCH_WINDOW_MS', 5))
+    PREDICT_MICROBATCH_MAX_SIZE = int(os.environ.get('PREDICT_MICROBATCH_MAX_SIZE', 32))
+    PREDICT_MICROBATCH_TIMEOUT = float(os.environ.get('PREDICT_MICROBATCH_TIMEOUT', 10))
+
+    # Opt-in write-behind for /predict: answer once scored and insert the
+    # rows from a background thread in batches. A full queue makes /predict
+    # wait up to WRITE_BEHIND_PUT_TIMEOUT seconds, then answer 503. Batches
+    # the database refuses are fsynced to the spool directory and retried.
+    PREDICT_WRITE_BEHIND = os.environ.get('PREDICT_WRITE_BEHIND', '0') == '1'
+    WRITE_BEHIND_QUEUE_SIZE = int(os.environ.get('WRITE_BEHIND_QUEUE_SIZE', 10000))
+    WRITE_BEHIND_BATCH_SIZE = int(os.environ.get('WRITE_BEHIND_BATCH_SIZE', 500))
+    WRITE_BEHIND_INTERVAL_MS = float(os.environ.get('WRITE_BEHIND_INTERVAL_MS', 200))
+    WRITE_BEHIND_PUT_TIMEOUT = float(os.environ.get('WRITE_BEHIND_PUT_TIMEOUT', 2.0))
+    WRITE_BEHIND_RETRY_DELAY = float(os.environ.get('WRITE_BEHIND_RETRY_DELAY', 5.0))
+    WRITE_BEHIND_SPOOL_DIR = os.environ.get('WRITE_BEHIND_SPOOL_DIR') or os.path.join(BASE_DIR, 'spool')
+
+    # Seconds between checks of the model files for a new version
+    MODEL_RELOAD_INTERVAL = float(os.environ.get('MODEL_RELOAD_INTERVAL', 1.0))
+
+    # Shared by the web workers to merge /metrics (empty: this process only)
+    METRICS_DIR = os.environ.get('METRICS_DIR', '')
+
+    REQUESTS_PAGE_SIZE = int(os.environ.get('REQUESTS_PAGE_SIZE', 50))
+    REQUESTS_PAGE_MAX = 200
+
+    # Rows per server-side cursor fetch (and per Parquet row group) in /api/export
+    EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', 5000))
+
+    # Live pipeline progress: open SSE streams per process (each holds a
+    # worker thread; beyond this the page polls /api/pipeline/progress),
+    # stream lifetime before the browser reconnects, and the poll interval
+    # used instead of LISTEN/NOTIFY on databases other than Postgres
+    SSE_MAX_STREAMS = int(os.environ.get('SSE_MAX_STREAMS', 8))
+    SSE_STREAM_SECONDS = int(os.environ.get('SSE_STREAM_SECONDS', 300))
+    PROGRESS_POLL_INTERVAL = float(os.environ.get('PROGRESS_POLL_INTERVAL', 2.0))
+
+    # Airflow triggers are queued and coalesced over this many seconds
+    AIRFLOW_TRIGGER_WINDOW = float(os.environ.get('AIRFLOW_TRIGGER_WINDOW', 2.0))
+    AIRFLOW_TRIGGER_RETRIES = int(os.environ.get('AIRFLOW_TRIGGER_RETRIES', 3))
+    AIRFLOW_TRIGGER_BACKOFF = float(os.environ.get('AIRFLOW_TRIGGER_BACKOFF', 1.0))
+    AIRFLOW_TRIGGER_TIMEOUT = float(os.environ.get('AIRFLOW_TRIGGER_TIMEOUT', 10))
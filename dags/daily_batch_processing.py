@@ -1,10 +1,65 @@
 
 from airflow import DAG
+from airflow.models.xcom_arg import XComArg
 from airflow.operators.python import PythonOperator
 from datetime import datetime, timedelta
 import pandas as pd
 import psycopg2
 import numpy as np
+import io
+import os
+import re
+import shutil
+import sys
+
+
+MODELS_DIR = '/opt/airflow/models'
+if MODELS_DIR not in sys.path:
+    sys.path.insert(0, MODELS_DIR)
+
+from features import score_applications, BATCH_DEFAULTS
+from model_registry import ModelRegistry
+from progress import report_progress
+from running_stats import load_outlier_bounds
+
+
+# Intermediate batches live on the shared uploads volume; XCom only carries
+# {'path': ..., 'rows': ...} references to them.
+BATCH_DIR = '/opt/airflow/uploads/batches'
+
+VALIDATE_COLUMNS = ['id', 'cin', 'client_name', 'annual_income', 'credit_score',
+                    'loan_amount', 'interest_rate']
+
+# Rows per keyset page; each page is validated, scored and loaded on its own
+EXTRACT_CHUNK_SIZE = int(os.environ.get('ETL_CHUNK_SIZE', 10000))
+
+# Same cutoff as kpis.HIGH_RISK_THRESHOLD in the web app
+HIGH_RISK_THRESHOLD = 50
+
+# What to do with an application whose CIN is already in simulations:
+#   skip        - drop it and mark it processed (default)
+#   rescore     - score and insert it next to the earlier simulations
+#   keep_latest - score it and replace the earlier simulations of that CIN
+#                 (column_stats keep counting the replaced rows until the
+#                 data_quality_monitoring DAG is run with rebuild_stats)
+CIN_DEDUP_POLICIES = ('skip', 'rescore', 'keep_latest')
+CIN_DEDUP_POLICY = os.environ.get('CIN_DEDUP_POLICY', 'skip')
+if CIN_DEDUP_POLICY not in CIN_DEDUP_POLICIES:
+    raise ValueError(f"CIN_DEDUP_POLICY must be one of {CIN_DEDUP_POLICIES}, not {CIN_DEDUP_POLICY!r}")
+
+# Cleaned rows per ml_task partition; partitions are scored as mapped task
+# instances, at most ML_MAX_PARALLEL at a time. Every instance runs in its
+# own process (LocalExecutor) and loads the model itself, so larger
+# partitions amortize that load over more rows.
+ML_PARTITION_SIZE = int(os.environ.get('ML_PARTITION_SIZE', 5000))
+ML_MAX_PARALLEL = int(os.environ.get('ML_MAX_PARALLEL', 8))
+
+LOAD_COLUMNS = ['staging_id', 'client_name', 'cin', 'phone', 'annual_income', 'credit_score',
+                'loan_amount', 'loan_term', 'interest_rate', 'risk_score', 'status']
+
+ML_COLUMNS = ['id', 'client_name', 'cin', 'phone', 'annual_income', 'debt_to_income_ratio',
+              'credit_score', 'loan_amount', 'loan_term', 'interest_rate', 'gender',
+              'marital_status', 'education_level', 'employment_status', 'loan_purpose']
 
 
 DB_CONFIG = {
@@ -15,6 +70,24 @@ DB_CONFIG = {
 }
 
 
+def _report_progress(context, **fields):
+    """Record this run's progress for the /pipeline page; never fails the task"""
+    try:
+        conn = psycopg2.connect(**DB_CONFIG)
+        try:
+            report_progress(conn.cursor(), context['run_id'], dag.dag_id, **fields)
+            conn.commit()
+        finally:
+            conn.close()
+    except psycopg2.Error as e:
+        print(f"⚠️  Progress not recorded: {e}")
+
+
+def _report_failure(context):
+    _report_progress(context, state='failed', stage=context['task_instance'].task_id,
+                     error=str(context.get('exception'))[:500])
+
+
 default_args = {
     'owner': 'nb_bank_data_engineering',
     'depends_on_past': False,
@@ -23,6 +96,7 @@ default_args = {
     'email_on_retry': False,
     'retries': 2,
     'retry_delay': timedelta(minutes=5),
+    'on_failure_callback': _report_failure,
 }
 
 
@@ -33,8 +107,34 @@ dag = DAG(
     schedule_interval='0 2 * * *',  
     catchup=False,
     tags=['etl', 'batch', 'ml', 'production'],
+    # Each run extracts the whole unprocessed backlog (conf staging_ids /
+    # staging_id_ranges from the web app are not used to narrow it), and
+    # every web worker triggers on its own: overlapping runs would extract
+    # and score the same rows, so later triggers queue behind the active run
+    max_active_runs=1,
 )
 
+
+def _run_dir(context):
+    """Directory holding the intermediate files of one DAG run"""
+    run_id = re.sub(r'[^A-Za-z0-9_.-]', '_', context['run_id'])
+    return os.path.join(BATCH_DIR, run_id)
+
+
+def _write_batch(df, context, name):
+    """Write a batch as Parquet and return the XCom reference to it"""
+    run_dir = _run_dir(context)
+    os.makedirs(run_dir, exist_ok=True)
+    path = os.path.join(run_dir, f'{name}.parquet')
+    df.to_parquet(path, index=False)
+    return {'path': path, 'rows': len(df)}
+
+
+def _read_batch(ref, columns=None):
+    """Read a batch written by _write_batch, optionally only some columns"""
+    return pd.read_parquet(ref['path'], columns=columns)
+
+
 def extract_new_applications(**context):
     """
     EXTRACT: Get unprocessed applications from staging table
@@ -43,62 +143,120 @@ def extract_new_applications(**context):
     print("🔵 EXTRACT PHASE: Getting new loan applications from staging...")
     print("=" * 80)
     
-    conn = psycopg2.connect(**DB_CONFIG)
+    _report_progress(context, state='running', stage='extract')
     
+    conn = psycopg2.connect(**DB_CONFIG)
     
-    query = """
+    # Keyset pagination on (uploaded_at, id), served by idx_staging_unprocessed
+    first_page = """
+        SELECT * FROM staging_applications 
+        WHERE processed = FALSE
+        ORDER BY uploaded_at ASC, id ASC
+        LIMIT %s
+    """
+    next_page = """
         SELECT * FROM staging_applications 
         WHERE processed = FALSE
-        ORDER BY uploaded_at ASC
+          AND (uploaded_at, id) > (%s, %s)
+        ORDER BY uploaded_at ASC, id ASC
+        LIMIT %s
     """
     
-    df = pd.read_sql(query, conn)
+    raw_refs = []
+    record_count = 0
+    last_key = None
+    
+    while True:
+        if last_key is None:
+            df = pd.read_sql(first_page, conn, params=(EXTRACT_CHUNK_SIZE,))
+        else:
+            df = pd.read_sql(next_page, conn, params=(*last_key, EXTRACT_CHUNK_SIZE))
+        
+        if len(df) == 0:
+            break
+        
+        raw_refs.append(_write_batch(df, context, f'raw_{len(raw_refs):05d}'))
+        record_count += len(df)
+        print(f"   ✓ Chunk {len(raw_refs)}: {len(df)} applications")
+        
+        if len(df) < EXTRACT_CHUNK_SIZE:
+            break
+        last_key = (df['uploaded_at'].iloc[-1].to_pydatetime(), int(df['id'].iloc[-1]))
+    
     conn.close()
     
-    record_count = len(df)
-    print(f"✅ Extracted {record_count} new applications from staging")
+    print(f"✅ Extracted {record_count} new applications from staging in {len(raw_refs)} chunks")
     
     if record_count == 0:
         print("⚠️  No new applications to process. Pipeline will skip remaining tasks.")
         return "No new applications found"
     
     
-    context['ti'].xcom_push(key='raw_applications', value=df.to_json(orient='records'))
+    context['ti'].xcom_push(key='raw_applications', value=raw_refs)
+    _report_progress(context, stage='extract', counts={'rows_staged': record_count})
     
     return f"Extracted {record_count} applications"
 
 
-def validate_and_clean_data(**context):
-    """
-    TRANSFORM STEP 1: Data Quality Checks & Cleaning
+def _known_cins(cursor, cins):
     """
-    print("=" * 80)
-    print("🟡 TRANSFORM PHASE 1: Data Validation & Cleaning...")
-    print("=" * 80)
-    
+    Return the subset of `cins` already present in simulations.
     
-    raw_json = context['ti'].xcom_pull(key='raw_applications', task_ids='extract_task')
-    
-    if raw_json is None:
-        print("⚠️  No data to validate. Skipping.")
-        return "No data"
-    
-    df = pd.read_json(raw_json, orient='records')
+    The chunk's CINs are COPY-ed into a temp table and semi-joined against
+    the primary key of simulation_cins (not simulations, where every monthly
+    partition would be probed), so the cost follows the chunk size rather
+    than the size or age of simulations. Rows are cleared on commit.
+    """
+    cursor.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS incoming_cins (cin VARCHAR(20))
+        ON COMMIT DELETE ROWS
+    """)
+    buf = io.StringIO()
+    pd.Series(cins, dtype=object).to_csv(buf, index=False, header=False)
+    buf.seek(0)
+    cursor.copy_expert("COPY incoming_cins (cin) FROM STDIN WITH (FORMAT csv)", buf)
+    cursor.execute("ANALYZE incoming_cins")
+    cursor.execute("""
+        SELECT i.cin FROM incoming_cins i
+        WHERE EXISTS (SELECT 1 FROM simulation_cins s WHERE s.cin = i.cin)
+    """)
+    known = {row[0] for row in cursor.fetchall()}
+    cursor.connection.commit()
+    return known
+
+
+def _clean_chunk(df, seen_cins, bounds, known_cins):
+    """
+    Apply the quality rules to one chunk. `seen_cins` carries the CINs seen
+    in earlier chunks so duplicates are dropped across the whole run;
+    `known_cins` are the chunk's CINs already in simulations, handled per
+    CIN_DEDUP_POLICY. `bounds` holds the persisted outlier cutoffs per
+    column; a column with no cutoffs yet falls back to the chunk's own mean / std.
+    
+    Returns the cleaned chunk, the staging ids skipped as history
+    duplicates, and the counts per rule.
+    """
     initial_count = len(df)
     
-    print(f"📊 Initial record count: {initial_count}")
-    
     
     df = df.drop_duplicates(subset=['cin'], keep='first')
+    df = df[~df['cin'].isin(seen_cins)]
     duplicates_removed = initial_count - len(df)
-    print(f"   ✓ Duplicates removed: {duplicates_removed}")
+    seen_cins.update(df['cin'].dropna())
+    
+    
+    in_history = df['cin'].isin(known_cins)
+    history_count = int(in_history.sum())
+    skipped_ids = []
+    if CIN_DEDUP_POLICY == 'skip':
+        skipped_ids = df.loc[in_history, 'id'].tolist()
+        df = df[~in_history]
     
     
     critical_columns = ['annual_income', 'credit_score', 'loan_amount', 'client_name']
     before_null = len(df)
     df = df.dropna(subset=critical_columns)
     nulls_removed = before_null - len(df)
-    print(f"   ✓ Records with missing values removed: {nulls_removed}")
     
     
     before_validation = len(df)
@@ -107,127 +265,196 @@ def validate_and_clean_data(**context):
     df = df[df['loan_amount'] > 0]
     df = df[df['interest_rate'] > 0]
     invalid_removed = before_validation - len(df)
-    print(f"   ✓ Invalid range records removed: {invalid_removed}")
     
     
+    before_outliers = len(df)
     numeric_cols = ['annual_income', 'loan_amount']
     for col in numeric_cols:
-        mean = df[col].mean()
-        std = df[col].std()
-        df = df[np.abs(df[col] - mean) <= (3 * std)]
-    outliers_removed = before_validation - len(df)
-    print(f"   ✓ Outliers removed: {outliers_removed}")
+        if bounds.get(col):
+            low, high = bounds[col]
+            df = df[df[col].between(low, high)]
+        else:
+            mean = df[col].mean()
+            std = df[col].std()
+            df = df[np.abs(df[col] - mean) <= (3 * std)]
+    outliers_removed = before_outliers - len(df)
+    
+    return df, skipped_ids, {
+        'initial': initial_count,
+        'final': len(df),
+        'duplicates': duplicates_removed,
+        'history_duplicates': history_count,
+        'nulls': nulls_removed,
+        'invalid': invalid_removed,
+        'outliers': outliers_removed,
+    }
+
+
+def validate_and_clean_data(**context):
+    """
+    TRANSFORM STEP 1: Data Quality Checks & Cleaning
+    """
+    print("=" * 80)
+    print("🟡 TRANSFORM PHASE 1: Data Validation & Cleaning...")
+    print("=" * 80)
+    
+    
+    raw_refs = context['ti'].xcom_pull(key='raw_applications', task_ids='extract_task')
+    
+    if raw_refs is None:
+        print("⚠️  No data to validate. Skipping.")
+        context['ti'].xcom_push(key='ml_partitions', value=[])
+        return "No data"
+    
+    conn = psycopg2.connect(**DB_CONFIG)
+    cursor = conn.cursor()
+    bounds = load_outlier_bounds(cursor, ['annual_income', 'loan_amount'])
+    
+    for col, cutoffs in bounds.items():
+        if cutoffs:
+            print(f"   Outlier cutoffs for {col}: [{cutoffs[0]:.2f}, {cutoffs[1]:.2f}] (column_stats)")
+        else:
+            print(f"   Outlier cutoffs for {col}: batch mean ± 3σ (not enough history)")
+    
+    totals = {'initial': 0, 'final': 0, 'duplicates': 0, 'history_duplicates': 0,
+              'nulls': 0, 'invalid': 0, 'outliers': 0}
+    seen_cins = set()
+    clean_refs = []
+    skipped_refs = []
+    
+    for i, raw_ref in enumerate(raw_refs):
+        df = _read_batch(raw_ref, columns=VALIDATE_COLUMNS)
+        known_cins = _known_cins(cursor, df['cin'].dropna().unique())
+        df, skipped_ids, stats = _clean_chunk(df, seen_cins, bounds, known_cins)
+        # Only the surviving ids are written; ml_task reads its columns from the raw file
+        clean_refs.append(_write_batch(df[['id']], context, f'cleaned_{i:05d}'))
+        if skipped_ids:
+            skipped_refs.append(_write_batch(pd.DataFrame({'id': skipped_ids}), context, f'skipped_{i:05d}'))
+        for key, value in stats.items():
+            totals[key] += value
+    
+    cursor.close()
+    conn.close()
     
-    cleaned_count = len(df)
+    initial_count = totals['initial']
+    cleaned_count = totals['final']
     total_removed = initial_count - cleaned_count
     
+    print(f"📊 Initial record count: {initial_count}")
+    print(f"   ✓ Duplicates removed: {totals['duplicates']}")
+    if CIN_DEDUP_POLICY == 'skip':
+        print(f"   ✓ Already in simulations, skipped: {totals['history_duplicates']}")
+    else:
+        print(f"   ✓ Already in simulations, kept ({CIN_DEDUP_POLICY}): {totals['history_duplicates']}")
+    print(f"   ✓ Records with missing values removed: {totals['nulls']}")
+    print(f"   ✓ Invalid range records removed: {totals['invalid']}")
+    print(f"   ✓ Outliers removed: {totals['outliers']}")
+    
     print(f"\n📈 Cleaning Summary:")
     print(f"   Initial records: {initial_count}")
     print(f"   Valid records: {cleaned_count}")
     print(f"   Total removed: {total_removed} ({total_removed/initial_count*100:.1f}%)")
     
     
-    context['ti'].xcom_push(key='cleaned_applications', value=df.to_json(orient='records'))
+    partitions = _plan_partitions(raw_refs, clean_refs, ML_PARTITION_SIZE)
+    print(f"   ML partitions: {len(partitions)} (up to {ML_PARTITION_SIZE} rows each)")
+    
+    context['ti'].xcom_push(key='cleaned_applications', value=clean_refs)
+    context['ti'].xcom_push(key='skipped_applications', value=skipped_refs)
+    context['ti'].xcom_push(key='ml_partitions', value=partitions)
+    _report_progress(context, stage='validate', counts={'rows_validated': cleaned_count, 'rows_scored': 0})
     context['ti'].xcom_push(key='quality_stats', value={
         'initial': initial_count,
         'final': cleaned_count,
-        'duplicates': duplicates_removed,
-        'nulls': nulls_removed,
-        'invalid': invalid_removed
+        'duplicates': totals['duplicates'],
+        'history_duplicates': totals['history_duplicates'],
+        'nulls': totals['nulls'],
+        'invalid': totals['invalid']
     })
     
     return f"Cleaned {cleaned_count} records"
 
 
-def feature_engineering_and_ml_prediction(**context):
+def _model_registry():
+    """A fresh registry: each task instance process loads the model once"""
+    return ModelRegistry(f'{MODELS_DIR}/loan_prediction_model.pkl', f'{MODELS_DIR}/data_scaler.pkl')
+
+
+def _score_chunk(df, scorer):
+    """Score one chunk and shape it like the simulations table"""
+    risk_scores, statuses = score_applications(scorer, df, defaults=BATCH_DEFAULTS)
+    
+    return pd.DataFrame({
+        'staging_id': df['id'].astype(int),
+        'client_name': df['client_name'],
+        'cin': df['cin'],
+        'phone': df['phone'] if 'phone' in df.columns else 'N/A',
+        'annual_income': df['annual_income'].astype(float),
+        'credit_score': df['credit_score'].astype(int),
+        'loan_amount': df['loan_amount'].astype(float),
+        'loan_term': df['loan_term'].astype(int) if 'loan_term' in df.columns else 60,
+        'interest_rate': df['interest_rate'].astype(float) if 'interest_rate' in df.columns else 5.0,
+        'risk_score': risk_scores,
+        'status': statuses,
+    })
+
+
+def _plan_partitions(raw_refs, clean_refs, partition_size):
+    """
+    Split the cleaned rows into ml_task partitions of at most partition_size
+    rows, each a slice of one extracted chunk. Returned as op_kwargs for
+    the mapped ml_task.
+    """
+    partitions = []
+    for raw_ref, clean_ref in zip(raw_refs, clean_refs):
+        for start in range(0, clean_ref['rows'], partition_size):
+            partitions.append({'partition': {
+                'index': len(partitions),
+                'raw': raw_ref,
+                'clean': clean_ref,
+                'start': start,
+                'stop': min(start + partition_size, clean_ref['rows']),
+            }})
+    return partitions
+
+
+def score_partition(partition, **context):
     """
-    TRANSFORM STEP 2: Feature Engineering + ML Predictions
+    TRANSFORM STEP 2: Feature Engineering + ML Predictions (one partition)
     """
     print("=" * 80)
-    print("🟢 TRANSFORM PHASE 2: Feature Engineering & ML Predictions...")
+    print(f"🟢 TRANSFORM PHASE 2: ML Predictions for partition {partition['index']}...")
     print("=" * 80)
     
+    registry = _model_registry()
+    artifacts = registry.get()
+    if artifacts is None:
+        print(f"⚠️  ML model not available: {registry.last_error}")
+        return None
     
-    clean_json = context['ti'].xcom_pull(key='cleaned_applications', task_ids='validate_task')
+    scorer = artifacts.scorer
+    print(f"🧠 Model version {artifacts.version} ({type(artifacts.model).__name__}, {scorer.kind} scorer)")
+    if scorer.fallback_reason:
+        print(f"   sklearn fallback: {scorer.fallback_reason}")
     
-    if clean_json is None:
-        print("⚠️  No data to process. Skipping.")
-        return "No data"
+    ids = _read_batch(partition['clean'], columns=['id'])['id'].iloc[partition['start']:partition['stop']]
+    df = _read_batch(partition['raw'], columns=ML_COLUMNS)
+    df = df[df['id'].isin(ids)]
     
-    df = pd.read_json(clean_json, orient='records')
+    results = _score_chunk(df, scorer)
+    ref = _write_batch(results, context, f"predictions_{partition['index']:05d}")
     
-    print(f"📊 Processing {len(df)} applications through ML model...")
-    model=None
-    scaler=None
-
-    try:
-        import joblib
-        model = joblib.load('/opt/airflow/models/loan_prediction_model.pkl')
-        scaler = joblib.load('/opt/airflow/models/data_scaler.pkl')
-    except Exception as e:
-        print(f"⚠️  ML model or joblib not available: {e}")
-        
-        context['ti'].xcom_push(key='predictions', value=[])
-        return "ML skipped"
-    
-    predictions = []
-    
-    for idx, row in df.iterrows():
-        
-        model_inputs = [
-            float(row['annual_income']),
-            float(row.get('debt_to_income_ratio', 30)),
-            float(row['credit_score']),
-            float(row['loan_amount']),
-            float(row.get('interest_rate', 5.0)),
-            1 if row.get('gender', 'Male') == 'Male' else 0,
-            1 if row.get('marital_status', 'Single') == 'Married' else 0,
-            1 if row.get('education_level', 'High School') == 'Graduate' else 0,
-            1 if row.get('employment_status', 'Unemployed') == 'Employed' else 0,
-            1 if row.get('loan_purpose', 'Personal') == 'Business' else 0,
-            1, 0, 1  
-        ]
-        
-        
-        features = np.array([model_inputs])
-        if scaler.n_features_in_ > len(model_inputs):
-            padding = np.zeros((1, scaler.n_features_in_ - len(model_inputs)))
-            features = np.hstack([features, padding])
-        
-        features_scaled = scaler.transform(features)
-        
-        
-        
-        proba_paid = model.predict_proba(features_scaled)[0][1] * 100
-        risk_score = round(100.0 - proba_paid, 2)
-        final_status = 'Approved' if proba_paid >= 50 else 'Rejected'
-        
-        predictions.append({
-            'staging_id': int(row['id']),
-            'client_name': row['client_name'],
-            'cin': row['cin'],
-            'phone': row.get('phone', 'N/A'),
-            'annual_income': float(row['annual_income']),
-            'credit_score': int(row['credit_score']),
-            'loan_amount': float(row['loan_amount']),
-            'loan_term': int(row.get('loan_term', 60)),
-            'interest_rate': float(row.get('interest_rate', 5.0)),
-            'risk_score': risk_score,
-            'status': final_status
-        })
-    
-    approved = sum(1 for p in predictions if p['status'] == 'Approved')
-    rejected = len(predictions) - approved
+    total = len(results)
+    approved = int((results['status'] == 'Approved').sum())
+    _report_progress(context, stage='score', increments={'rows_scored': total}, partition=partition['index'])
     
     print(f"\n📊 ML Prediction Results:")
-    print(f"   Total processed: {len(predictions)}")
-    print(f"   ✅ Approved: {approved} ({approved/len(predictions)*100:.1f}%)")
-    print(f"   ❌ Rejected: {rejected} ({rejected/len(predictions)*100:.1f}%)")
-    
-    
-    context['ti'].xcom_push(key='predictions', value=predictions)
+    print(f"   Total processed: {total}")
+    if total:
+        print(f"   ✅ Approved: {approved} ({approved/total*100:.1f}%)")
+        print(f"   ❌ Rejected: {total - approved} ({(total - approved)/total*100:.1f}%)")
     
-    return f"Processed {len(predictions)} predictions"
+    return dict(ref, approved=approved)
 
 
 def load_to_production_database(**context):
@@ -239,59 +466,123 @@ def load_to_production_database(**context):
     print("=" * 80)
     
     
-    predictions = context['ti'].xcom_pull(key='predictions', task_ids='ml_task')
+    # One reference per mapped ml_task instance (None where the model was unavailable)
+    prediction_refs = [ref for ref in context['ti'].xcom_pull(task_ids='ml_task') or [] if ref]
+    skipped_refs = context['ti'].xcom_pull(key='skipped_applications', task_ids='validate_task') or []
     
-    if predictions is None or len(predictions) == 0:
+    if not prediction_refs and not skipped_refs:
         print("⚠️  No predictions to load. Skipping.")
+        _report_progress(context, state='success', stage='load')
         return "No data"
     
     conn = psycopg2.connect(**DB_CONFIG)
     cursor = conn.cursor()
     
-    loaded = 0
-    staging_ids = []
-    
-    for pred in predictions:
-        try:
-            
-            cursor.execute("""
-                INSERT INTO simulations 
-                (client_name, cin, phone, annual_income, credit_score, 
-                 loan_amount, loan_term, interest_rate, risk_score, status, date_added)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW())
-            """, (
-                pred['client_name'],
-                pred['cin'],
-                pred['phone'],
-                pred['annual_income'],
-                pred['credit_score'],
-                pred['loan_amount'],
-                pred['loan_term'],
-                pred['interest_rate'],
-                pred['risk_score'],
-                pred['status']
-            ))
-            
-            loaded += 1
-            staging_ids.append(pred['staging_id'])
-            
-        except Exception as e:
-            print(f"❌ Error loading record: {e}")
-    
-    
-    if staging_ids:
+    # Stream every partition into a temp table with COPY (dropped at commit)
+    cursor.execute("""
+        CREATE TEMP TABLE load_predictions (
+            staging_id INTEGER PRIMARY KEY,
+            client_name VARCHAR(100),
+            cin VARCHAR(20),
+            phone VARCHAR(20),
+            annual_income FLOAT,
+            credit_score INTEGER,
+            loan_amount FLOAT,
+            loan_term INTEGER,
+            interest_rate FLOAT,
+            risk_score FLOAT,
+            status VARCHAR(20)
+        ) ON COMMIT DROP
+    """)
+    staged = 0
+    for ref in prediction_refs:
+        buf = io.StringIO()
+        _read_batch(ref, columns=LOAD_COLUMNS).to_csv(buf, index=False, header=False)
+        buf.seek(0)
+        cursor.copy_expert(f"COPY load_predictions ({', '.join(LOAD_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buf)
+        staged += ref['rows']
+    cursor.execute("ANALYZE load_predictions")
+    
+    # One statement claims the still-unprocessed staging rows and inserts
+    # their simulations. A staging row is only ever claimed once, so a retry
+    # after a crash (nothing committed) or after success (already processed)
+    # cannot insert the same application twice. keep_latest also deletes
+    # the earlier simulations of the claimed CINs; new CINs are recorded in
+    # simulation_cins for the next runs' history check.
+    cursor.execute("""
+        WITH claimed AS (
+            UPDATE staging_applications st
+            SET processed = TRUE
+            FROM load_predictions p
+            WHERE st.id = p.staging_id AND st.processed = FALSE
+            RETURNING p.*
+        ),
+        replaced AS (
+            DELETE FROM simulations s
+            USING claimed c
+            WHERE %(keep_latest)s AND s.cin = c.cin
+            RETURNING s.risk_score, s.loan_amount
+        ),
+        inserted AS (
+            INSERT INTO simulations 
+            (client_name, cin, phone, annual_income, credit_score, 
+             loan_amount, loan_term, interest_rate, risk_score, status, date_added)
+            SELECT client_name, cin, phone, annual_income, credit_score,
+                   loan_amount, loan_term, interest_rate, risk_score, status, NOW()
+            FROM claimed
+            RETURNING risk_score, loan_amount
+        ),
+        remembered AS (
+            INSERT INTO simulation_cins (cin)
+            SELECT DISTINCT cin FROM claimed WHERE cin IS NOT NULL
+            ORDER BY cin
+            ON CONFLICT (cin) DO NOTHING
+        )
+        SELECT
+            (SELECT COUNT(*) FROM inserted),
+            (SELECT COUNT(*) FROM inserted WHERE risk_score > %(threshold)s),
+            (SELECT COALESCE(SUM(loan_amount), 0) FROM inserted),
+            (SELECT COUNT(*) FROM replaced),
+            (SELECT COUNT(*) FROM replaced WHERE risk_score > %(threshold)s),
+            (SELECT COALESCE(SUM(loan_amount), 0) FROM replaced)
+    """, {'keep_latest': CIN_DEDUP_POLICY == 'keep_latest', 'threshold': HIGH_RISK_THRESHOLD})
+    loaded, high_risk, volume, replaced, replaced_high_risk, replaced_volume = cursor.fetchone()
+    
+    # Applications skipped as already in simulations are done with as well
+    skipped_ids = [int(i) for ref in skipped_refs for i in _read_batch(ref)['id']]
+    if skipped_ids:
         cursor.execute("""
             UPDATE staging_applications 
             SET processed = TRUE 
             WHERE id = ANY(%s)
-        """, (staging_ids,))
+        """, (skipped_ids,))
+    
+    # Keep the dashboard KPIs in step with simulations (same transaction)
+    cursor.execute("""
+        UPDATE kpi_summary 
+        SET total_clients = total_clients + %s,
+            high_risk_count = high_risk_count + %s,
+            total_volume = total_volume + %s,
+            updated_at = NOW()
+        WHERE id = 1
+    """, (loaded - replaced, high_risk - replaced_high_risk, volume - replaced_volume))
     
     conn.commit()
     cursor.close()
     conn.close()
     
     print(f"\n✅ Successfully loaded {loaded} records to production database")
-    print(f"✅ Marked {len(staging_ids)} staging records as processed")
+    print(f"✅ Marked {loaded} staging records as processed")
+    if staged > loaded:
+        print(f"   {staged - loaded} predictions were already loaded by an earlier attempt")
+    if skipped_ids:
+        print(f"✅ Marked {len(skipped_ids)} already-simulated applications as processed (skipped)")
+    if replaced:
+        print(f"✅ Replaced {replaced} earlier simulations of the same CINs (keep_latest)")
+    
+    _report_progress(context, state='success', stage='load',
+                     counts={'rows_scored': sum(ref['rows'] for ref in prediction_refs), 'rows_loaded': loaded})
+    shutil.rmtree(_run_dir(context), ignore_errors=True)
     
     return f"Loaded {loaded} records"
 
@@ -309,15 +600,18 @@ validate_task = PythonOperator(
     dag=dag,
 )
 
-ml_task = PythonOperator(
+ml_task = PythonOperator.partial(
     task_id='ml_task',
-    python_callable=feature_engineering_and_ml_prediction,
+    python_callable=score_partition,
+    max_active_tis_per_dag=ML_MAX_PARALLEL,
     dag=dag,
-)
+).expand(op_kwargs=XComArg(validate_task, key='ml_partitions'))
 
+# Runs when there was nothing to score (ml_task expanded to zero instances)
 load_task = PythonOperator(
     task_id='load_task',
     python_callable=load_to_production_database,
+    trigger_rule='none_failed',
     dag=dag,
 )
 
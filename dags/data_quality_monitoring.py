@@ -7,7 +7,14 @@ from airflow import DAG
 from airflow.operators.python import PythonOperator
 from datetime import datetime, timedelta
 import psycopg2
-import pandas as pd
+import sys
+
+
+MODELS_DIR = '/opt/airflow/models'
+if MODELS_DIR not in sys.path:
+    sys.path.insert(0, MODELS_DIR)
+
+from running_stats import rebuild_stats, refresh_stats, outlier_bounds, NUMERIC_COLUMNS, TEXT_COLUMNS
 
 
 DB_CONFIG = {
@@ -32,110 +39,82 @@ dag = DAG(
     schedule_interval='0 */6 * * *',  
     catchup=False,
     tags=['quality', 'monitoring', 'validation'],
+    max_active_runs=1,
 )
 
-def check_missing_values(**context):
-    """Check for missing critical values"""
-    print("🔍 Checking for missing values...")
+def refresh_quality_stats(**context):
+    """
+    Fold the simulations added since the last run into column_stats and
+    report the running totals: missing values, duplicate CINs and
+    3-sigma outliers. Cost is proportional to the new rows, plus one
+    indexed range query per column for the outliers.
+
+    Trigger with conf {"rebuild_stats": true} to refold the whole table,
+    e.g. after keep_latest deduplication deleted simulations.
+    """
+    dag_run = context.get('dag_run')
+    rebuild = bool(dag_run and (dag_run.conf or {}).get('rebuild_stats'))
+    print("🔍 Rebuilding quality statistics from the whole table..." if rebuild
+          else "🔍 Updating running quality statistics...")
     
     conn = psycopg2.connect(**DB_CONFIG)
     cursor = conn.cursor()
     
+    stats = rebuild_stats(cursor) if rebuild else refresh_stats(cursor)
+    conn.commit()
     
-    checks = {
-        'client_name': "SELECT COUNT(*) FROM simulations WHERE client_name IS NULL OR client_name = ''",
-        'cin': "SELECT COUNT(*) FROM simulations WHERE cin IS NULL OR cin = ''",
-        'annual_income': "SELECT COUNT(*) FROM simulations WHERE annual_income IS NULL",
-        'credit_score': "SELECT COUNT(*) FROM simulations WHERE credit_score IS NULL",
-        'loan_amount': "SELECT COUNT(*) FROM simulations WHERE loan_amount IS NULL",
-    }
+    cursor.close()
+    conn.close()
     
-    issues = {}
-    total_issues = 0
+    if not stats:
+        print("   ✅ No simulations yet")
+    else:
+        print(f"   Rows folded in up to id {max(s['watermark_id'] for s in stats.values())}")
     
-    for column, query in checks.items():
-        cursor.execute(query)
-        count = cursor.fetchone()[0]
+    # Missing values
+    total_missing = 0
+    for column in TEXT_COLUMNS + NUMERIC_COLUMNS:
+        count = stats.get(column, {}).get('null_count', 0)
         if count > 0:
-            issues[column] = count
-            total_issues += count
+            total_missing += count
             print(f"   ⚠️  {column}: {count} missing values")
     
-    cursor.close()
-    conn.close()
-    
-    if total_issues == 0:
+    if total_missing == 0:
         print("   ✅ No missing values detected")
     else:
-        print(f"\n⚠️  Total missing values: {total_issues}")
+        print(f"\n⚠️  Total missing values: {total_missing}")
     
-    context['ti'].xcom_push(key='missing_values', value=total_issues)
-    
-    return f"Missing values: {total_issues}"
-
-
-def check_duplicates(**context):
-    """Check for duplicate CINs"""
-    print("🔍 Checking for duplicate CINs...")
-    
-    conn = psycopg2.connect(**DB_CONFIG)
-    cursor = cursor.execute("""
-        SELECT cin, COUNT(*) as cnt 
-        FROM simulations 
-        WHERE cin IS NOT NULL 
-        GROUP BY cin 
-        HAVING COUNT(*) > 1
-    """)
-    
-    duplicates = cursor.fetchall()
-    dup_count = len(duplicates)
+    # Duplicate CINs
+    dup_count = stats.get('cin', {}).get('duplicate_count', 0)
     
     if dup_count > 0:
-        print(f"   ⚠️  Found {dup_count} duplicate CINs:")
-        for cin, count in duplicates[:5]:  
-            print(f"      - {cin}: {count} occurrences")
+        print(f"   ⚠️  Found {dup_count} duplicate CINs (running count: CINs deduplicated since by "
+              f"keep_latest stay counted until a rebuild_stats run)")
     else:
         print("   ✅ No duplicate CINs found")
     
-    cursor.close()
-    conn.close()
-    
-    context['ti'].xcom_push(key='duplicates', value=dup_count)
-    
-    return f"Duplicates: {dup_count}"
-
-
-def check_outliers(**context):
-    """Check for statistical outliers"""
-    print("🔍 Checking for outliers...")
-    
-    conn = psycopg2.connect(**DB_CONFIG)
-    
-    
-    df = pd.read_sql("SELECT annual_income, loan_amount, credit_score FROM simulations", conn)
-    conn.close()
-    
-    outliers = {}
-    
-    
-    for col in ['annual_income', 'loan_amount', 'credit_score']:
-        mean = df[col].mean()
-        std = df[col].std()
-        outlier_mask = abs(df[col] - mean) > (3 * std)
-        count = outlier_mask.sum()
-        
-        if count > 0:
-            outliers[col] = count
-            print(f"   ⚠️  {col}: {count} outliers detected")
-    
-    total_outliers = sum(outliers.values())
+    # Outliers
+    total_outliers = 0
+    for col in NUMERIC_COLUMNS:
+        col_stats = stats.get(col)
+        if not col_stats:
+            continue
+        bounds = outlier_bounds(col_stats)
+        if bounds:
+            print(f"   {col}: n={col_stats['n']} mean={col_stats['mean']:.2f} "
+                  f"cutoffs=[{bounds[0]:.2f}, {bounds[1]:.2f}]")
+        if col_stats['outlier_count'] > 0:
+            total_outliers += col_stats['outlier_count']
+            print(f"   ⚠️  {col}: {col_stats['outlier_count']} outliers detected")
     
     if total_outliers == 0:
         print("   ✅ No statistical outliers detected")
     
-    context['ti'].xcom_push(key='outliers', value=total_outliers)
+    context['ti'].xcom_push(key='missing_values', value=int(total_missing))
+    context['ti'].xcom_push(key='duplicates', value=int(dup_count))
+    context['ti'].xcom_push(key='outliers', value=int(total_outliers))
     
-    return f"Outliers: {total_outliers}"
+    return f"Missing: {total_missing}, duplicates: {dup_count}, outliers: {total_outliers}"
 
 
 def generate_quality_report(**context):
@@ -144,13 +123,13 @@ def generate_quality_report(**context):
     print("📊 DATA QUALITY REPORT")
     print("=" * 80)
     
-    missing = context['ti'].xcom_pull(key='missing_values', task_ids='check_missing')
-    duplicates = context['ti'].xcom_pull(key='duplicates', task_ids='check_duplicates')
-    outliers = context['ti'].xcom_pull(key='outliers', task_ids='check_outliers')
+    missing = context['ti'].xcom_pull(key='missing_values', task_ids='quality_stats')
+    duplicates = context['ti'].xcom_pull(key='duplicates', task_ids='quality_stats')
+    outliers = context['ti'].xcom_pull(key='outliers', task_ids='quality_stats')
     
     print(f"\n📋 Summary:")
     print(f"   Missing Values: {missing}")
-    print(f"   Duplicate CINs: {duplicates}")
+    print(f"   Duplicate CINs: {duplicates} (running count, exact after rebuild_stats)")
     print(f"   Statistical Outliers: {outliers}")
     
     total_issues = missing + duplicates + outliers
@@ -168,21 +147,9 @@ def generate_quality_report(**context):
 
 
 
-missing_task = PythonOperator(
-    task_id='check_missing',
-    python_callable=check_missing_values,
-    dag=dag,
-)
-
-duplicates_task = PythonOperator(
-    task_id='check_duplicates',
-    python_callable=check_duplicates,
-    dag=dag,
-)
-
-outliers_task = PythonOperator(
-    task_id='check_outliers',
-    python_callable=check_outliers,
+stats_task = PythonOperator(
+    task_id='quality_stats',
+    python_callable=refresh_quality_stats,
     dag=dag,
 )
 
@@ -193,4 +160,4 @@ report_task = PythonOperator(
 )
 
 
-[missing_task, duplicates_task, outliers_task] >> report_task
\ No newline at end of file
+stats_task >> report_task
\ No newline at end of file
@@ -0,0 +1,222 @@
+"""
+NB BANK - Warehouse Maintenance Pipeline
+Creates the monthly simulations partitions ahead of time and moves processed
+staging rows out of the hot staging table, daily
+"""
+
+from airflow import DAG
+from airflow.operators.python import PythonOperator
+from datetime import date, datetime, timedelta
+from psycopg2 import sql
+import psycopg2
+import os
+import time
+
+
+DB_CONFIG = {
+    'host': 'db',
+    'database': 'bank_warehouse',
+    'user': 'admin',
+    'password': 'pfe_password'
+}
+
+# Monthly partitions kept ready beyond the current month
+PARTITION_MONTHS_AHEAD = int(os.environ.get('PARTITION_MONTHS_AHEAD', 3))
+# Creating a partition gives up after waiting this long for its locks (a
+# long export holding simulations_default) and retries later, instead of
+# queueing and blocking every insert behind it
+PARTITION_LOCK_TIMEOUT = int(os.environ.get('PARTITION_LOCK_TIMEOUT', 5))
+PARTITION_LOCK_RETRIES = int(os.environ.get('PARTITION_LOCK_RETRIES', 10))
+PARTITION_RETRY_DELAY = int(os.environ.get('PARTITION_RETRY_DELAY', 30))
+
+# Processed staging rows older than this are archived
+STAGING_RETENTION_DAYS = int(os.environ.get('STAGING_RETENTION_DAYS', 7))
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', 10000))
+
+default_args = {
+    'owner': 'nb_bank_data_engineering',
+    'depends_on_past': False,
+    'start_date': datetime(2026, 2, 1),
+    'retries': 1,
+    'retry_delay': timedelta(minutes=5),
+}
+
+dag = DAG(
+    'warehouse_maintenance',
+    default_args=default_args,
+    description='Partition simulations by month and archive processed staging rows',
+    schedule_interval='0 4 * * *',
+    catchup=False,
+    tags=['maintenance', 'partitioning', 'archival'],
+    max_active_runs=1,
+)
+
+
+def _add_months(month, n):
+    month_index = month.year * 12 + month.month - 1 + n
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def _create_partition(cursor, month):
+    """
+    Create and attach the simulations partition for `month`, first moving
+    its rows out of simulations_default (ATTACH refuses to run while the
+    default partition still holds rows of the new range). The caller
+    commits; until then inserts routed to the default partition wait, so
+    none can land there between the move and the ATTACH. Raises
+    LockNotAvailable after PARTITION_LOCK_TIMEOUT seconds on a lock; the
+    caller rolls back and retries.
+    """
+    name = sql.Identifier(f"simulations_{month:%Y_%m}")
+    start, end = month, _add_months(month, 1)
+
+    cursor.execute(sql.SQL("""
+        CREATE TABLE {} (LIKE simulations INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+    """).format(name))
+    # Both the lock below and the ATTACH's ACCESS EXCLUSIVE lock on the
+    # default partition fail with LockNotAvailable rather than wait long
+    cursor.execute("SET LOCAL lock_timeout = %s", (f"{PARTITION_LOCK_TIMEOUT}s",))
+    # Waits for in-flight inserts into the default partition, then blocks new ones
+    cursor.execute("LOCK TABLE simulations_default IN SHARE ROW EXCLUSIVE MODE")
+    cursor.execute(sql.SQL("""
+        WITH moved AS (
+            DELETE FROM simulations_default
+            WHERE date_added >= %s AND date_added < %s
+            RETURNING *
+        )
+        INSERT INTO {} SELECT * FROM moved
+    """).format(name), (start, end))
+    moved = cursor.rowcount
+    cursor.execute(sql.SQL("""
+        ALTER TABLE simulations ATTACH PARTITION {} FOR VALUES FROM (%s) TO (%s)
+    """).format(name), (start, end))
+    return moved
+
+
+def create_simulations_partitions(**context):
+    """
+    Make sure simulations has a partition for this month, the next
+    PARTITION_MONTHS_AHEAD months and every month found in the default partition
+    """
+    print("=" * 80)
+    print("🗂️  Creating monthly simulations partitions...")
+    print("=" * 80)
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    cursor = conn.cursor()
+
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = 'simulations'::regclass")
+    if cursor.fetchone()[0] != 'p':
+        print("⚠️  simulations is not a partitioned table (database created before partitioning). Skipping.")
+        conn.close()
+        return "Not partitioned"
+
+    this_month = date.today().replace(day=1)
+    wanted = {_add_months(this_month, n) for n in range(PARTITION_MONTHS_AHEAD + 1)}
+    cursor.execute("SELECT DISTINCT date_trunc('month', date_added)::date FROM simulations_default")
+    wanted.update(row[0] for row in cursor.fetchall())
+
+    created = 0
+    existing = 0
+    for month in sorted(wanted):
+        cursor.execute("SELECT to_regclass(%s)", (f"simulations_{month:%Y_%m}",))
+        if cursor.fetchone()[0] is not None:
+            existing += 1
+            continue
+        for attempt in range(1, PARTITION_LOCK_RETRIES + 1):
+            try:
+                moved = _create_partition(cursor, month)
+                conn.commit()
+                break
+            except psycopg2.errors.LockNotAvailable:
+                conn.rollback()
+                if attempt == PARTITION_LOCK_RETRIES:
+                    raise
+                print(f"   ⏳ simulations_{month:%Y_%m}: lock not granted within {PARTITION_LOCK_TIMEOUT}s, "
+                      f"retrying in {PARTITION_RETRY_DELAY}s ({attempt}/{PARTITION_LOCK_RETRIES})")
+                time.sleep(PARTITION_RETRY_DELAY)
+        created += 1
+        print(f"   ✓ simulations_{month:%Y_%m} created ({moved} rows moved from simulations_default)")
+
+    cursor.close()
+    conn.close()
+
+    print(f"✅ {created} partitions created, {existing} already in place")
+
+    return f"Created {created} partitions"
+
+
+def archive_processed_staging(**context):
+    """
+    Move processed staging rows older than STAGING_RETENTION_DAYS into
+    staging_applications_archive, ARCHIVE_BATCH_SIZE rows per transaction
+    (found through idx_staging_archivable), then vacuum the hot table so
+    the freed space is reused
+    """
+    print("=" * 80)
+    print("📦 Archiving processed staging applications...")
+    print("=" * 80)
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    cursor = conn.cursor()
+
+    archived = 0
+    while True:
+        cursor.execute("""
+            WITH moved AS (
+                DELETE FROM staging_applications
+                WHERE id IN (
+                    SELECT id FROM staging_applications
+                    WHERE processed = TRUE
+                      AND uploaded_at < NOW() - make_interval(days => %s)
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING *
+            )
+            INSERT INTO staging_applications_archive
+                (id, client_name, cin, phone, annual_income, debt_to_income_ratio,
+                 credit_score, loan_amount, loan_term, interest_rate, gender,
+                 marital_status, education_level, employment_status, loan_purpose,
+                 processed, uploaded_at)
+            SELECT id, client_name, cin, phone, annual_income, debt_to_income_ratio,
+                   credit_score, loan_amount, loan_term, interest_rate, gender,
+                   marital_status, education_level, employment_status, loan_purpose,
+                   processed, uploaded_at
+            FROM moved
+        """, (STAGING_RETENTION_DAYS, ARCHIVE_BATCH_SIZE))
+        moved = cursor.rowcount
+        conn.commit()
+        archived += moved
+        if moved:
+            print(f"   ✓ {moved} rows archived")
+        if moved < ARCHIVE_BATCH_SIZE:
+            break
+
+    if archived:
+        conn.autocommit = True
+        cursor.execute("VACUUM (ANALYZE) staging_applications")
+
+    cursor.close()
+    conn.close()
+
+    print(f"✅ Archived {archived} processed staging rows older than {STAGING_RETENTION_DAYS} days")
+
+    return f"Archived {archived} rows"
+
+
+
+partition_task = PythonOperator(
+    task_id='create_partitions',
+    python_callable=create_simulations_partitions,
+    dag=dag,
+)
+
+archive_task = PythonOperator(
+    task_id='archive_staging',
+    python_callable=archive_processed_staging,
+    dag=dag,
+)
+
+
+partition_task >> archive_task
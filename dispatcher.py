@@ -0,0 +1,224 @@
+"""
+NB BANK - Background dispatcher for Airflow DAG triggers
+Uploads return immediately; triggers that arrive within a short window are
+coalesced into one DAG run and posted from a worker thread over a pooled
+HTTP session, with retry and exponential backoff.
+
+The queue lives in each web worker process: under gunicorn every worker
+coalesces only its own triggers, so N workers can start up to N runs in a
+window, and /api/dispatch_status describes the worker that answered (its
+pid is in the response). The batch DAG runs one at a time
+(max_active_runs=1) and reads the whole unprocessed backlog, so extra runs
+only queue behind the first and find little left to do.
+"""
+
+import atexit
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from urllib.parse import urljoin
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# conf keys whose list values are concatenated when runs are coalesced
+MERGE_KEYS = ('staging_ids', 'staging_id_ranges')
+HISTORY_SIZE = 20
+
+
+class _PendingRun:
+    def __init__(self, dag_id, dispatch_id):
+        self.dag_id = dag_id
+        self.dispatch_id = dispatch_id
+        self.created = time.monotonic()
+        self.created_at = datetime.now()
+        self.requests = 0
+        self.full_run = False
+        self.conf = {}
+
+    def add(self, conf):
+        """Merge one caller's conf; an empty conf means 'process everything'"""
+        self.requests += 1
+        if not conf:
+            self.full_run = True
+            return
+        for key, value in conf.items():
+            if key in MERGE_KEYS:
+                self.conf.setdefault(key, []).extend(value)
+            else:
+                self.conf[key] = value
+
+    def payload(self):
+        if self.full_run:
+            return {key: value for key, value in self.conf.items() if key not in MERGE_KEYS}
+        return self.conf
+
+    def describe(self):
+        return {
+            'dispatch_id': self.dispatch_id,
+            'dag_id': self.dag_id,
+            'requests': self.requests,
+            'staging_ids': len(self.conf.get('staging_ids', [])),
+            'staging_id_ranges': len(self.conf.get('staging_id_ranges', [])),
+            'full_run': self.full_run,
+            'queued_at': self.created_at.isoformat(),
+        }
+
+
+class DagDispatcher:
+    """
+    Queue DAG triggers and post them to the Airflow REST API from a daemon
+    thread. A run is sent `window` seconds after its first request; requests
+    for the same DAG arriving meanwhile are merged into it.
+
+    Failed triggers are retried `retries` times (backoff doubling from
+    `backoff` seconds) and then recorded as failed; the rows stay in staging
+    for the next scheduled run.
+    """
+
+    def __init__(self, host, auth, window=2.0, retries=3, backoff=1.0, timeout=10, pool_size=4):
+        self.host = host
+        self.window = window
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        self.session.auth = auth
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._pending = {}
+        self._in_flight = None
+        self._history = deque(maxlen=HISTORY_SIZE)
+        self._counters = {'requests': 0, 'coalesced': 0, 'dispatched': 0, 'failed': 0, 'retries': 0}
+        self._next_id = 1
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+
+    def submit(self, dag_id, conf=None):
+        """Queue a trigger and return at once with the run it was merged into"""
+        with self._cond:
+            run = self._pending.get(dag_id)
+            if run is None:
+                run = self._pending[dag_id] = _PendingRun(dag_id, self._next_id)
+                self._next_id += 1
+            else:
+                self._counters['coalesced'] += 1
+            run.add(conf or {})
+            self._counters['requests'] += 1
+            self._ensure_worker()
+            self._cond.notify()
+            return {'queued': True, 'dispatch_id': run.dispatch_id, 'coalesced_requests': run.requests}
+
+    def state(self):
+        """Snapshot of pending, in-flight and recent dispatches of this process"""
+        with self._cond:
+            return {
+                'pid': os.getpid(),
+                'window_seconds': self.window,
+                'pending': [run.describe() for run in self._pending.values()],
+                'in_flight': dict(self._in_flight) if self._in_flight else None,
+                'recent': list(self._history),
+                'counters': dict(self._counters),
+            }
+
+    def flush(self, timeout=None):
+        """Dispatch everything pending now and wait for it (used at shutdown)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            for run in self._pending.values():
+                run.created -= self.window
+            self._cond.notify()
+            while self._pending or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout=10):
+        self.flush(timeout)
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self.session.close()
+
+    def _ensure_worker(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='dag-dispatcher', daemon=True)
+            self._thread.start()
+
+    def _next_due(self):
+        """Pop the run whose window has closed, else return the seconds to wait"""
+        now = time.monotonic()
+        wait = None
+        for dag_id, run in self._pending.items():
+            remaining = run.created + self.window - now
+            if remaining <= 0:
+                del self._pending[dag_id]
+                return run, None
+            wait = remaining if wait is None else min(wait, remaining)
+        return None, wait
+
+    def _run(self):
+        while True:
+            with self._cond:
+                run, wait = self._next_due()
+                while run is None:
+                    if self._stopping:
+                        return
+                    self._cond.wait(wait)
+                    run, wait = self._next_due()
+                self._in_flight = dict(run.describe(), attempts=0)
+
+            result = self._post(run)
+
+            with self._cond:
+                self._in_flight = None
+                self._counters['dispatched' if result['ok'] else 'failed'] += 1
+                self._history.appendleft(dict(run.describe(), **result))
+                self._cond.notify_all()
+
+    def _post(self, run):
+        api_url = urljoin(self.host, f'/api/v1/dags/{run.dag_id}/dagRuns')
+        delay = self.backoff
+        attempt = 0
+        while True:
+            attempt += 1
+            with self._cond:
+                self._in_flight['attempts'] = attempt
+            try:
+                resp = self.session.post(api_url, json={'conf': run.payload()}, timeout=self.timeout)
+                if resp.status_code in (200, 201):
+                    return self._result(True, attempt, resp.json().get('dag_run_id'))
+                # Client errors will not succeed on retry
+                retryable = resp.status_code == 429 or resp.status_code >= 500
+                error = f'HTTP {resp.status_code}: {resp.text[:200]}'
+            except requests.RequestException as e:
+                retryable = True
+                error = str(e)
+
+            if not retryable or attempt > self.retries:
+                return self._result(False, attempt, error=error)
+            with self._cond:
+                self._counters['retries'] += 1
+            time.sleep(delay)
+            delay *= 2
+
+    @staticmethod
+    def _result(ok, attempts, dag_run_id=None, error=None):
+        return {'ok': ok, 'attempts': attempts, 'dag_run_id': dag_run_id, 'error': error,
+                'finished_at': datetime.now().isoformat()}
+
+
+def create_dispatcher(host, auth, window, retries, backoff, timeout):
+    """Build a dispatcher that flushes pending triggers at interpreter exit"""
+    dispatcher = DagDispatcher(host, auth, window=window, retries=retries, backoff=backoff, timeout=timeout)
+    atexit.register(dispatcher.close)
+    return dispatcher
@@ -0,0 +1,98 @@
+"""
+NB BANK - Streaming exports of simulations
+Rows come off a server-side cursor in batches and are written out batch by
+batch, as CSV text or as one Parquet row group per batch, so memory stays
+bounded by the batch size however many rows are exported.
+"""
+
+import csv
+import io
+
+
+# Parquet type per exported column (pyarrow type factory names)
+PARQUET_TYPES = {
+    'id': 'int64',
+    'client_name': 'string',
+    'cin': 'string',
+    'phone': 'string',
+    'annual_income': 'float64',
+    'credit_score': 'int32',
+    'loan_amount': 'float64',
+    'loan_term': 'int32',
+    'interest_rate': 'float64',
+    'risk_score': 'float64',
+    'status': 'string',
+    'date_added': 'timestamp',
+}
+
+
+def iter_row_batches(engine, stmt, batch_size):
+    """
+    Yield lists of at most `batch_size` rows from a server-side cursor.
+    One pooled connection is held until the generator is exhausted or closed.
+    """
+    with engine.connect() as conn:
+        result = conn.execution_options(yield_per=batch_size).execute(stmt)
+        for batch in result.partitions():
+            yield batch
+
+
+def iter_csv(columns, batches):
+    """CSV text: the header first (sent before any row is read), then one piece per batch"""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(columns)
+    yield buf.getvalue()
+
+    for batch in batches:
+        buf.seek(0)
+        buf.truncate()
+        writer.writerows(batch)
+        yield buf.getvalue()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands back what was written since the last drain"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_parquet(columns, batches):
+    """Parquet bytes: one row group per batch, the footer last"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    types = {name: pa.timestamp('us') if kind == 'timestamp' else getattr(pa, kind)()
+             for name, kind in PARQUET_TYPES.items()}
+    schema = pa.schema([(name, types[name]) for name in columns])
+
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        yield sink.drain()
+        for batch in batches:
+            arrays = [pa.array(values, type=schema.field(i).type)
+                      for i, values in enumerate(zip(*batch))]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
@@ -0,0 +1,123 @@
+"""
+NB BANK - Feature encoding shared by the web app and the batch DAG
+Builds the model input matrix column-wise and scores it in one call
+"""
+
+import numpy as np
+
+
+NUMERIC_FEATURES = [
+    'annual_income',
+    'debt_to_income_ratio',
+    'credit_score',
+    'loan_amount',
+    'interest_rate',
+]
+
+# (column, value that encodes to 1)
+FLAG_FEATURES = [
+    ('gender', 'Male'),
+    ('marital_status', 'Married'),
+    ('education_level', 'Graduate'),
+    ('employment_status', 'Employed'),
+    ('loan_purpose', 'Business'),
+]
+
+CONSTANT_TAIL = [1, 0, 1]
+
+# Fallbacks used by /predict when a form field is missing
+FORM_DEFAULTS = {
+    'annual_income': 0,
+    'debt_to_income_ratio': 0,
+    'credit_score': 0,
+    'loan_amount': 0,
+    'interest_rate': 0,
+    'gender': None,
+    'marital_status': None,
+    'education_level': None,
+    'employment_status': None,
+    'loan_purpose': None,
+}
+
+# Fallbacks used by the DAG when a staging column is missing
+BATCH_DEFAULTS = {
+    'annual_income': 0,
+    'debt_to_income_ratio': 30,
+    'credit_score': 0,
+    'loan_amount': 0,
+    'interest_rate': 5.0,
+    'gender': 'Male',
+    'marital_status': 'Single',
+    'education_level': 'High School',
+    'employment_status': 'Unemployed',
+    'loan_purpose': 'Personal',
+}
+
+
+def _column(records, name, default):
+    """Return one input column as an array (DataFrame or list of mappings)"""
+    if hasattr(records, 'columns'):
+        if name in records.columns:
+            return records[name].to_numpy()
+        return np.full(len(records), default, dtype=object)
+    return np.array([r.get(name, default) for r in records], dtype=object)
+
+
+def _count(records):
+    return len(records.index) if hasattr(records, 'columns') else len(records)
+
+
+def encode_features(records, n_features, defaults=None):
+    """
+    Encode applications into the model input matrix.
+
+    `records` is a pandas DataFrame or a list of dict-like rows. Missing
+    columns fall back to `defaults` (FORM_DEFAULTS if not given). The
+    matrix is zero-padded on the right up to `n_features` columns.
+    """
+    defaults = FORM_DEFAULTS if defaults is None else defaults
+    n_rows = _count(records)
+    width = len(NUMERIC_FEATURES) + len(FLAG_FEATURES) + len(CONSTANT_TAIL)
+
+    features = np.zeros((n_rows, max(n_features, width)), dtype=np.float64)
+
+    col = 0
+    for name in NUMERIC_FEATURES:
+        features[:, col] = _column(records, name, defaults.get(name, 0)).astype(np.float64)
+        col += 1
+
+    for name, positive in FLAG_FEATURES:
+        features[:, col] = _column(records, name, defaults.get(name)) == positive
+        col += 1
+
+    features[:, col:col + len(CONSTANT_TAIL)] = CONSTANT_TAIL
+
+    return features
+
+
+def score_features(scorer, features):
+    """
+    Score an encoded feature matrix with one call to a compiled scorer
+    (see scorer.compile_scorer).
+
+    Returns (risk_scores, statuses): risk of default in percent rounded to
+    two decimals, and 'Approved' / 'Rejected' per row.
+    """
+    if len(features) == 0:
+        return np.zeros(0), np.array([], dtype=object)
+
+    return decisions(scorer.predict_paid_proba(features))
+
+
+def decisions(proba_paid):
+    """(risk_scores, statuses) from the probability of the 'paid' class"""
+    proba_paid = proba_paid * 100
+    risk_scores = np.round(100.0 - proba_paid, 2)
+    statuses = np.where(proba_paid >= 50, 'Approved', 'Rejected').astype(object)
+
+    return risk_scores, statuses
+
+
+def score_applications(scorer, records, defaults=None):
+    """Encode and score a batch of applications (see score_features)"""
+    return score_features(scorer, encode_features(records, scorer.n_features, defaults))
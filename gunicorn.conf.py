@@ -0,0 +1,80 @@
+"""
+NB BANK - Production server settings
+
+    gunicorn -c gunicorn.conf.py app:app
+
+The app (and the model, MODEL_PRELOAD=1) is loaded once in the master and
+the workers are forked from it, so they share the model pages copy-on-write.
+Every worker opens its own DB pool (Config.DB_POOL_SIZE / DB_MAX_OVERFLOW).
+
+Graceful restart: `kill -HUP <master>` replaces the workers one set at a
+time, finishing in-flight requests first (up to WEB_GRACEFUL_TIMEOUT).
+Because the app is preloaded, code changes need a full restart; new model
+files are picked up without one (see model_registry.py).
+"""
+
+import gc
+import multiprocessing
+import os
+import shutil
+
+# Defaults for the master, set before config.py / the app are imported.
+# One OpenMP thread per worker: the workers already use every core.
+os.environ.setdefault('MODEL_PRELOAD', '1')
+os.environ.setdefault('OMP_NUM_THREADS', '1')
+os.environ.setdefault('METRICS_DIR', '/tmp/nb_bank_metrics')
+# An SSE stream holds a worker thread; keep one thread per worker for requests
+os.environ.setdefault('SSE_MAX_STREAMS', str(max(int(os.environ.get('WEB_THREADS', 1)) - 1, 0)))
+
+from config import Config  # noqa: E402
+
+
+bind = os.environ.get('WEB_BIND', '0.0.0.0:5000')
+workers = Config.WEB_WORKERS or multiprocessing.cpu_count()
+threads = Config.WEB_THREADS
+timeout = Config.WEB_TIMEOUT
+graceful_timeout = Config.WEB_GRACEFUL_TIMEOUT
+
+# Micro-batches are collected from the threads of one worker: with a single
+# thread every /predict would wait out the window alone. Its wait must also
+# end (503) before the worker timeout kills the worker.
+if Config.PREDICT_MICROBATCH:
+    if threads < 2:
+        raise RuntimeError("PREDICT_MICROBATCH=1 needs WEB_THREADS > 1 (gthread workers)")
+    if Config.PREDICT_MICROBATCH_TIMEOUT >= timeout:
+        raise RuntimeError("PREDICT_MICROBATCH_TIMEOUT must be shorter than WEB_TIMEOUT")
+
+# Recycle workers now and then so leaks cannot build up
+max_requests = Config.WEB_MAX_REQUESTS
+max_requests_jitter = max_requests // 10
+
+preload_app = True
+
+accesslog = '-'
+errorlog = '-'
+
+
+def on_starting(server):
+    # Metric snapshots from a previous run would be counted again
+    shutil.rmtree(Config.METRICS_DIR, ignore_errors=True)
+
+
+def when_ready(server):
+    # Move everything loaded so far out of the collector's reach, so GC
+    # passes in the workers do not write to (and un-share) those pages
+    gc.freeze()
+    server.log.info(f"Forking {workers} workers x {threads} threads")
+
+
+def child_exit(server, worker):
+    # An exited (or recycled) worker's counters must not be merged forever,
+    # nor picked up by a later worker that gets the same pid
+    from app import metrics
+    metrics.remove_snapshot(worker.pid)
+
+
+def post_fork(server, worker):
+    # Connections opened by the master at import time must not be shared
+    from app import app, db
+    with app.app_context():
+        db.engine.dispose(close=False)
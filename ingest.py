@@ -0,0 +1,83 @@
+"""
+NB BANK - Streaming CSV ingestion into staging_applications
+Parses uploads chunk by chunk so memory stays bounded by the chunk size
+"""
+
+import codecs
+import csv
+
+from sqlalchemy import insert
+
+from models import StagingApplication
+
+
+MAX_REJECTED_SAMPLES = 50
+
+
+def parse_staging_row(row):
+    """Convert one CSV row into staging_applications columns (raises ValueError)"""
+    return {
+        'client_name': row.get('client_name') or 'Batch Client',
+        'cin': row.get('cin'),
+        'phone': row.get('phone'),
+        'annual_income': float(row.get('annual_income') or 0),
+        'debt_to_income_ratio': float(row.get('debt_to_income_ratio') or 0),
+        'credit_score': int(row.get('credit_score') or 0),
+        'loan_amount': float(row.get('loan_amount') or 0),
+        'loan_term': int(row.get('loan_term') or 36),
+        'interest_rate': float(row.get('interest_rate') or 5),
+        'gender': row.get('gender'),
+        'marital_status': row.get('marital_status'),
+        'education_level': row.get('education_level'),
+        'employment_status': row.get('employment_status'),
+        'loan_purpose': row.get('loan_purpose'),
+    }
+
+
+def iter_csv_chunks(binary_stream, chunk_size):
+    """
+    Yield (rows, rejected) per chunk of at most `chunk_size` CSV lines.
+
+    `rows` are parsed staging dicts, `rejected` is a list of
+    (line_number, error) for rows that failed conversion.
+    """
+    # Not io.TextIOWrapper: on Python < 3.11 the SpooledTemporaryFile behind
+    # large Werkzeug uploads has no readable()/seekable(). Lines keep their
+    # endings, so quoted fields with newlines still parse.
+    text_stream = codecs.getreader('utf-8-sig')(binary_stream)
+    reader = csv.DictReader(text_stream)
+    rows, rejected = [], []
+
+    for row in reader:
+        try:
+            rows.append(parse_staging_row(row))
+        except (TypeError, ValueError) as e:
+            rejected.append((reader.line_num, str(e)))
+
+        if len(rows) + len(rejected) >= chunk_size:
+            yield rows, rejected
+            rows, rejected = [], []
+
+    if rows or rejected:
+        yield rows, rejected
+
+
+def add_id_range(id_ranges, ids):
+    """Append the [min, max] of a chunk's ids, extending the last range when contiguous"""
+    if not ids:
+        return
+    low, high = min(ids), max(ids)
+    if id_ranges and id_ranges[-1][1] + 1 == low:
+        id_ranges[-1][1] = high
+    else:
+        id_ranges.append([low, high])
+
+
+def insert_staging_chunk(session, rows):
+    """Insert a chunk with one multi-row INSERT ... RETURNING id"""
+    if not rows:
+        return []
+
+    table = StagingApplication.__table__
+    stmt = insert(table).values([dict(r, processed=False) for r in rows]).returning(table.c.id)
+    return [int(row[0]) for row in session.execute(stmt)]
@@ -4,7 +4,7 @@ CREATE DATABASE airflow_db;
 
 \c bank_warehouse;
 
--
+
 CREATE TABLE IF NOT EXISTS staging_applications (
     id SERIAL PRIMARY KEY,
     client_name VARCHAR(100),
@@ -25,9 +25,27 @@ CREATE TABLE IF NOT EXISTS staging_applications (
     uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Keyset pagination of the unprocessed backlog (extract_task)
+CREATE INDEX IF NOT EXISTS idx_staging_unprocessed
+    ON staging_applications (uploaded_at, id)
+    WHERE processed = FALSE;
+
+-- Processed rows due for archiving (warehouse_maintenance)
+CREATE INDEX IF NOT EXISTS idx_staging_archivable
+    ON staging_applications (uploaded_at)
+    WHERE processed = TRUE;
+
+-- /pipeline "recent uploads" list (covering)
+CREATE INDEX IF NOT EXISTS idx_staging_uploaded_at
+    ON staging_applications (uploaded_at DESC)
+    INCLUDE (id, client_name, cin);
 
+
+-- Partitioned by month on date_added; the warehouse_maintenance DAG creates
+-- the monthly partitions ahead of time. Rows with no partition of their
+-- own land in simulations_default until it does.
 CREATE TABLE IF NOT EXISTS simulations (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     client_name VARCHAR(100),
     cin VARCHAR(20),
     phone VARCHAR(20),
@@ -38,5 +56,114 @@ CREATE TABLE IF NOT EXISTS simulations (
     interest_rate FLOAT,
     risk_score FLOAT,
     status VARCHAR(20),
-    date_added TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
\ No newline at end of file
+    date_added TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, date_added)
+) PARTITION BY RANGE (date_added);
+
+CREATE TABLE IF NOT EXISTS simulations_default
+    PARTITION OF simulations DEFAULT;
+
+-- Newest-first listings (/dashboard, /requests keyset pages)
+CREATE INDEX IF NOT EXISTS idx_simulations_date_added
+    ON simulations (date_added DESC, id DESC);
+
+-- /requests filtered by status
+CREATE INDEX IF NOT EXISTS idx_simulations_status_date
+    ON simulations (status, date_added DESC, id DESC);
+
+-- /requests filtered on high risk
+CREATE INDEX IF NOT EXISTS idx_simulations_high_risk
+    ON simulations (date_added DESC, id DESC)
+    WHERE risk_score > 50;
+
+-- Duplicate-CIN checks in the quality DAG
+CREATE INDEX IF NOT EXISTS idx_simulations_cin
+    ON simulations (cin);
+
+-- Outlier recounts in the quality DAG (running_stats._count_outliers)
+CREATE INDEX IF NOT EXISTS idx_simulations_annual_income
+    ON simulations (annual_income);
+CREATE INDEX IF NOT EXISTS idx_simulations_loan_amount
+    ON simulations (loan_amount);
+CREATE INDEX IF NOT EXISTS idx_simulations_credit_score
+    ON simulations (credit_score);
+
+
+-- Every CIN present in simulations, once: the batch DAG's history dedup
+-- looks CINs up here instead of in every monthly partition (see cins.py)
+CREATE TABLE IF NOT EXISTS simulation_cins (
+    cin VARCHAR(20) PRIMARY KEY
+);
+
+
+-- Dashboard KPIs, bumped by every insert into simulations (see kpis.py)
+CREATE TABLE IF NOT EXISTS kpi_summary (
+    id INTEGER PRIMARY KEY,
+    total_clients INTEGER NOT NULL DEFAULT 0,
+    high_risk_count INTEGER NOT NULL DEFAULT 0,
+    total_volume FLOAT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO kpi_summary (id) VALUES (1) ON CONFLICT (id) DO NOTHING;
+
+
+-- Running statistics per simulations column (see running_stats.py)
+CREATE TABLE IF NOT EXISTS column_stats (
+    column_name VARCHAR(50) PRIMARY KEY,
+    n BIGINT NOT NULL DEFAULT 0,
+    mean FLOAT NOT NULL DEFAULT 0,
+    m2 FLOAT NOT NULL DEFAULT 0,
+    min_value FLOAT,
+    max_value FLOAT,
+    null_count BIGINT NOT NULL DEFAULT 0,
+    outlier_count BIGINT NOT NULL DEFAULT 0,
+    duplicate_count BIGINT NOT NULL DEFAULT 0,
+    watermark_id INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+
+-- Processed staging rows moved out of the hot table by the
+-- warehouse_maintenance DAG
+CREATE TABLE IF NOT EXISTS staging_applications_archive (
+    id INTEGER PRIMARY KEY,
+    client_name VARCHAR(100),
+    cin VARCHAR(20),
+    phone VARCHAR(20),
+    annual_income FLOAT,
+    debt_to_income_ratio FLOAT,
+    credit_score INTEGER,
+    loan_amount FLOAT,
+    loan_term INTEGER,
+    interest_rate FLOAT,
+    gender VARCHAR(20),
+    marital_status VARCHAR(50),
+    education_level VARCHAR(50),
+    employment_status VARCHAR(50),
+    loan_purpose VARCHAR(50),
+    processed BOOLEAN,
+    uploaded_at TIMESTAMP,
+    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+
+-- Per-run progress of the batch DAG, pushed to /pipeline (see progress.py)
+CREATE TABLE IF NOT EXISTS pipeline_progress (
+    run_id VARCHAR(250) PRIMARY KEY,
+    dag_id VARCHAR(250) NOT NULL,
+    state VARCHAR(20) NOT NULL DEFAULT 'running',
+    stage VARCHAR(50),
+    rows_staged INTEGER NOT NULL DEFAULT 0,
+    rows_validated INTEGER NOT NULL DEFAULT 0,
+    rows_scored INTEGER NOT NULL DEFAULT 0,
+    rows_loaded INTEGER NOT NULL DEFAULT 0,
+    -- Counters reported per mapped task: {"rows_scored": {"<map index>": n}}
+    partition_counts JSONB NOT NULL DEFAULT '{}',
+    error TEXT,
+    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_pipeline_progress_updated
+    ON pipeline_progress (updated_at DESC);
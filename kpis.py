@@ -0,0 +1,66 @@
+"""
+NB BANK - Dashboard KPIs kept in a single summary row
+Every insert into simulations bumps kpi_summary in the same transaction,
+so the dashboard reads one row instead of scanning the table.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from models import db, KpiSummary, Simulation
+
+
+HIGH_RISK_THRESHOLD = 50
+SUMMARY_ID = 1
+
+
+def bump_kpis(risk_scores, loan_amounts):
+    """Add newly inserted simulations to the summary (caller commits)"""
+    risk_scores = list(risk_scores)
+    if not risk_scores:
+        return
+    KpiSummary.query.filter_by(id=SUMMARY_ID).update({
+        KpiSummary.total_clients: KpiSummary.total_clients + len(risk_scores),
+        KpiSummary.high_risk_count: KpiSummary.high_risk_count + sum(1 for r in risk_scores if r > HIGH_RISK_THRESHOLD),
+        KpiSummary.total_volume: KpiSummary.total_volume + float(sum(a or 0 for a in loan_amounts)),
+        KpiSummary.updated_at: datetime.now(),
+    }, synchronize_session=False)
+
+
+def rebuild_kpis():
+    """Recompute the summary row from simulations with one full scan (caller commits)"""
+    total, high_risk, volume = db.session.query(
+        func.count(Simulation.id),
+        func.count(Simulation.id).filter(Simulation.risk_score > HIGH_RISK_THRESHOLD),
+        func.sum(Simulation.loan_amount),
+    ).one()
+
+    summary = db.session.get(KpiSummary, SUMMARY_ID) or KpiSummary(id=SUMMARY_ID)
+    summary.total_clients = total
+    summary.high_risk_count = high_risk
+    summary.total_volume = volume or 0
+    summary.updated_at = datetime.now()
+    db.session.add(summary)
+    return summary
+
+
+def ensure_kpis():
+    """Create the summary row on first start (commits)"""
+    if db.session.get(KpiSummary, SUMMARY_ID) is None:
+        rebuild_kpis()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Another worker created it first
+            db.session.rollback()
+
+
+def read_kpis():
+    """Return the summary row, rebuilding it if it is missing"""
+    summary = db.session.get(KpiSummary, SUMMARY_ID)
+    if summary is None:
+        summary = rebuild_kpis()
+        db.session.commit()
+    return summary
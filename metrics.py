@@ -0,0 +1,331 @@
+"""
+NB BANK - Request and stage instrumentation
+Latency histograms per endpoint and per stage, DB query counts per request,
+rendered as Prometheus text (/metrics) or a JSON summary (/api/metrics).
+
+Each process keeps its own series. When METRICS_DIR is set (gunicorn.conf.py
+does), every process also writes a snapshot there, and both endpoints merge
+the snapshots so a scrape sees all workers whichever one answers it. Only
+snapshots of live workers of the same master are merged; the master removes
+a worker's snapshot when it exits (gunicorn child_exit).
+"""
+
+import atexit
+import bisect
+import glob
+import json
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+# name -> (type, help, buckets)
+SERIES = {
+    'nb_request_duration_seconds': ('histogram', 'Request latency by endpoint', LATENCY_BUCKETS),
+    'nb_stage_duration_seconds': ('histogram', 'Latency of one stage of a request', LATENCY_BUCKETS),
+    'nb_request_db_queries': ('histogram', 'SQL statements executed per request', QUERY_BUCKETS),
+    'nb_requests_total': ('counter', 'Requests by endpoint and status code', None),
+    'nb_prediction_cache_lookups_total': ('counter', 'Prediction cache lookups by result', None),
+    'nb_predict_microbatch_size': ('histogram', 'Single /predict calls scored and committed together', BATCH_BUCKETS),
+}
+
+SNAPSHOT_INTERVAL = 1.0
+
+
+def _key(labels):
+    return tuple(sorted(labels.items()))
+
+
+class Metrics:
+    """Thread-safe in-process store of counters and fixed-bucket histograms"""
+
+    def __init__(self, snapshot_dir=None):
+        self.snapshot_dir = snapshot_dir or None
+        self._series = {name: {} for name in SERIES}
+        self._lock = threading.Lock()
+        self._snapshot_at = 0.0
+
+    def init_app(self, app):
+        app.before_request(self._start_request)
+        app.after_request(self._end_request)
+        event.listen(Engine, 'before_cursor_execute', _count_query)
+        if self.snapshot_dir:
+            atexit.register(self.write_snapshot)
+
+    def observe(self, name, value, **labels):
+        buckets = SERIES[name][2]
+        with self._lock:
+            hist = self._series[name].get(_key(labels))
+            if hist is None:
+                hist = self._series[name][_key(labels)] = {'buckets': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+            i = bisect.bisect_left(buckets, value)
+            if i < len(buckets):
+                hist['buckets'][i] += 1
+            hist['sum'] += value
+            hist['count'] += 1
+
+    def inc(self, name, amount=1, **labels):
+        with self._lock:
+            series = self._series[name]
+            series[_key(labels)] = series.get(_key(labels), 0) + amount
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Time a block of the current request as stage `name`. Repeated blocks
+        (one per chunk, say) add up to one observation per request; blocks
+        run after the response started (streaming) are observed one by one.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            stages = g.get('metrics_stages')
+            if stages is not None:
+                stages[name] = stages.get(name, 0.0) + elapsed
+            else:
+                self.observe('nb_stage_duration_seconds', elapsed,
+                             endpoint=request.endpoint or 'unknown', stage=name)
+
+    def _start_request(self):
+        g.metrics_start = time.perf_counter()
+        g.metrics_queries = 0
+        g.metrics_stages = {}
+
+    def _end_request(self, response):
+        start = g.pop('metrics_start', None)
+        stages = g.pop('metrics_stages', None) or {}
+        if start is None or request.endpoint in (None, 'static'):
+            return response
+        endpoint = request.endpoint
+        self.observe('nb_request_duration_seconds', time.perf_counter() - start, endpoint=endpoint)
+        self.observe('nb_request_db_queries', g.pop('metrics_queries', 0), endpoint=endpoint)
+        for stage, elapsed in stages.items():
+            self.observe('nb_stage_duration_seconds', elapsed, endpoint=endpoint, stage=stage)
+        self.inc('nb_requests_total', endpoint=endpoint, status=str(response.status_code))
+        self._maybe_snapshot()
+        return response
+
+    # -- snapshots shared between worker processes -------------------------
+
+    def _dump(self):
+        with self._lock:
+            return {name: [[list(map(list, key)), value if not isinstance(value, dict) else
+                            dict(value, buckets=list(value['buckets']))]
+                           for key, value in series.items()]
+                    for name, series in self._series.items()}
+
+    def _snapshot_path(self, pid=None):
+        return os.path.join(self.snapshot_dir, f'{pid or os.getpid()}.json')
+
+    def write_snapshot(self):
+        if not self.snapshot_dir:
+            return
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        path = self._snapshot_path()
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self._dump(), f)
+        os.replace(tmp, path)
+
+    def remove_snapshot(self, pid):
+        """Drop the snapshot of an exited process"""
+        if not self.snapshot_dir:
+            return
+        path = self._snapshot_path(pid)
+        for leftover in (path, f'{path}.tmp'):
+            try:
+                os.remove(leftover)
+            except FileNotFoundError:
+                pass
+
+    def _maybe_snapshot(self):
+        now = time.monotonic()
+        if self.snapshot_dir and now - self._snapshot_at >= SNAPSHOT_INTERVAL:
+            self._snapshot_at = now
+            try:
+                self.write_snapshot()
+            except OSError:
+                pass
+
+    def collect(self):
+        """All series, merged over this process and the other processes' snapshots"""
+        dumps = [self._dump()]
+        if self.snapshot_dir:
+            own = self._snapshot_path()
+            for path in glob.glob(os.path.join(self.snapshot_dir, '*.json')):
+                if path == own:
+                    continue
+                pid = os.path.basename(path)[:-len('.json')]
+                if not pid.isdigit() or not _is_sibling(int(pid)):
+                    continue
+                try:
+                    with open(path) as f:
+                        dumps.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+
+        merged = {name: {} for name in SERIES}
+        for dump in dumps:
+            for name, entries in dump.items():
+                if name not in merged:
+                    continue
+                for key, value in entries:
+                    key = tuple(tuple(pair) for pair in key)
+                    current = merged[name].get(key)
+                    if isinstance(value, dict):
+                        if current is None:
+                            merged[name][key] = dict(value, buckets=list(value['buckets']))
+                        else:
+                            current['buckets'] = [a + b for a, b in zip(current['buckets'], value['buckets'])]
+                            current['sum'] += value['sum']
+                            current['count'] += value['count']
+                    else:
+                        merged[name][key] = (current or 0) + value
+        return merged
+
+    # -- output -------------------------------------------------------------
+
+    def render_prometheus(self, gauges=None):
+        lines = []
+        for name, series in self.collect().items():
+            kind, help_text, buckets = SERIES[name]
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for key, value in sorted(series.items()):
+                labels = dict(key)
+                if kind == 'counter':
+                    lines.append(f'{name}{_labels(labels)} {value}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets, value['buckets']):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_labels(labels, le=_number(bound))} {cumulative}')
+                lines.append(f'{name}_bucket{_labels(labels, le="+Inf")} {value["count"]}')
+                lines.append(f'{name}_sum{_labels(labels)} {value["sum"]!r}')
+                lines.append(f'{name}_count{_labels(labels)} {value["count"]}')
+        for name, (help_text, value) in (gauges or {}).items():
+            if value is None:
+                continue
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} gauge')
+            lines.append(f'{name} {value!r}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """Per-endpoint latency, query counts and stage breakdown for the dashboard"""
+        series = self.collect()
+        endpoints = {}
+        for key, hist in series['nb_request_duration_seconds'].items():
+            endpoint = dict(key)['endpoint']
+            endpoints[endpoint] = {
+                'requests': hist['count'],
+                'avg_ms': _ms(hist['sum'] / hist['count']) if hist['count'] else None,
+                'p50_ms': _ms(quantile(hist, LATENCY_BUCKETS, 0.50)),
+                'p95_ms': _ms(quantile(hist, LATENCY_BUCKETS, 0.95)),
+                'p99_ms': _ms(quantile(hist, LATENCY_BUCKETS, 0.99)),
+                'stages': {},
+            }
+        for key, hist in series['nb_request_db_queries'].items():
+            endpoint = dict(key)['endpoint']
+            if endpoint in endpoints and hist['count']:
+                endpoints[endpoint]['db_queries_per_request'] = round(hist['sum'] / hist['count'], 2)
+        for key, hist in series['nb_stage_duration_seconds'].items():
+            labels = dict(key)
+            if labels['endpoint'] in endpoints and hist['count']:
+                endpoints[labels['endpoint']]['stages'][labels['stage']] = {
+                    'count': hist['count'],
+                    'avg_ms': _ms(hist['sum'] / hist['count']),
+                    'p95_ms': _ms(quantile(hist, LATENCY_BUCKETS, 0.95)),
+                }
+        return endpoints
+
+
+def _is_sibling(pid):
+    """Whether `pid` is alive and was forked by this process's parent (the gunicorn master)"""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            stat = f.read()
+    except FileNotFoundError:
+        return False
+    except OSError:
+        # No /proc: settle for the process being alive
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+    # The parent pid is the second field after the parenthesized command name
+    return int(stat.rsplit(')', 1)[1].split()[1]) == os.getppid()
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'metrics_queries' in g:
+        g.metrics_queries += 1
+
+
+def quantile(hist, buckets, q):
+    """Estimate a quantile from bucket counts (linear within a bucket, like PromQL)"""
+    if not hist['count']:
+        return None
+    rank = q * hist['count']
+    cumulative = 0
+    lower = 0.0
+    for bound, count in zip(buckets, hist['buckets']):
+        if count and cumulative + count >= rank:
+            return lower + (bound - lower) * (rank - cumulative) / count
+        cumulative += count
+        lower = bound
+    return buckets[-1]
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+def _number(value):
+    return repr(float(value))
+
+
+def _labels(labels, **extra):
+    items = list(labels.items()) + list(extra.items())
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in items) + '}'
+
+
+def system_usage(path):
+    """CPU (1-min load per core), RAM and disk usage in percent (None when unknown)"""
+    usage = {'cpu': None, 'ram': None, 'storage': None}
+    try:
+        usage['cpu'] = round(min(os.getloadavg()[0] / (os.cpu_count() or 1), 1.0) * 100, 1)
+    except (AttributeError, OSError):
+        pass
+    try:
+        meminfo = {}
+        with open('/proc/meminfo') as f:
+            for line in f:
+                name, value = line.split(':', 1)
+                meminfo[name] = int(value.split()[0])
+        usage['ram'] = round((1 - meminfo['MemAvailable'] / meminfo['MemTotal']) * 100, 1)
+    except (OSError, KeyError, ValueError):
+        pass
+    try:
+        disk = shutil.disk_usage(path)
+        usage['storage'] = round(disk.used / disk.total * 100, 1)
+    except OSError:
+        pass
+    return usage
@@ -0,0 +1,124 @@
+"""
+NB BANK - Dynamic micro-batching of concurrent single predictions
+Request threads hand their item to a background thread and block. The
+thread waits at most `window` seconds after the first item (or until
+`max_size` items are queued), runs the handler once on the whole batch and
+hands each waiting request its own result.
+"""
+
+import atexit
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as BatchTimeout
+
+
+class MicroBatcher:
+    """
+    Collect items from concurrent callers and process them together.
+    `handler(items)` returns one result per item, in order; if it raises,
+    every caller of that batch gets the exception.
+    """
+
+    def __init__(self, handler, window=0.005, max_size=32, name='micro-batcher'):
+        self.handler = handler
+        self.window = window
+        self.max_size = max_size
+        self.name = name
+
+        self._queue = deque()
+        self._counters = {'items': 0, 'batches': 0, 'failed_batches': 0, 'largest_batch': 0}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+
+    def submit(self, item, timeout=None):
+        """
+        Queue one item and wait for its result. Raises BatchTimeout after
+        `timeout` seconds; the item is then dropped unless its batch is
+        already being processed.
+        """
+        future = Future()
+        with self._cond:
+            if self._stopping:
+                raise RuntimeError(f'{self.name} is closed')
+            self._queue.append((item, future))
+            self._ensure_worker()
+            self._cond.notify()
+        try:
+            return future.result(timeout)
+        except BatchTimeout:
+            future.cancel()
+            raise
+
+    def stats(self):
+        with self._cond:
+            counters = dict(self._counters)
+            queued = len(self._queue)
+        batches = counters['batches']
+        return dict(counters, queued=queued, window_ms=self.window * 1000, max_size=self.max_size,
+                    avg_batch=round(counters['items'] / batches, 2) if batches else 0)
+
+    def close(self, timeout=10):
+        """Process what is queued, then stop the worker (used at shutdown)"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None and thread.is_alive():
+            thread.join(timeout)
+
+    def _ensure_worker(self):
+        # Also restarts the thread in forked worker processes
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def _next_batch(self):
+        """Wait for a first item, then for the window to close or the batch to fill"""
+        with self._cond:
+            while not self._queue:
+                if self._stopping:
+                    return None
+                self._cond.wait()
+            deadline = time.monotonic() + self.window
+            while len(self._queue) < self.max_size and not self._stopping:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = [self._queue.popleft() for _ in range(min(len(self._queue), self.max_size))]
+        # Callers that timed out have cancelled their futures
+        return [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            if not batch:
+                continue
+            try:
+                results = self.handler([item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                failed = True
+            else:
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+                failed = False
+
+            with self._cond:
+                self._counters['items'] += len(batch)
+                self._counters['batches'] += 1
+                self._counters['failed_batches'] += failed
+                self._counters['largest_batch'] = max(self._counters['largest_batch'], len(batch))
+
+
+def create_micro_batcher(handler, window, max_size, name='micro-batcher'):
+    """Build a batcher that finishes its queued items at interpreter exit"""
+    batcher = MicroBatcher(handler, window=window, max_size=max_size, name=name)
+    atexit.register(batcher.close)
+    return batcher
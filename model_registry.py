@@ -0,0 +1,198 @@
+"""
+NB BANK - Lazy, hot-reloadable registry for the loan model artifacts
+
+Artifacts are loaded on first use (numpy arrays memory-mapped where joblib
+can), warmed with a dummy prediction, and identified by the SHA-256 of
+their bytes. When the files change on disk the new set is loaded next to
+the old one and swapped in atomically; callers keep whatever snapshot
+they already hold until they ask again.
+
+Roll out a new model by writing it to a temporary name and os.replace()-ing
+it over the old file, so memory-mapped readers never see a partial write.
+
+An optional JSON sidecar (model_metrics.json) carries the offline evaluation
+of a model; it is only trusted when its model_sha256 matches the model file.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import joblib
+
+from cache import FileVersion
+from features import encode_features, score_features
+from scorer import compile_scorer
+
+
+logger = logging.getLogger(__name__)
+
+CHECKSUM_CHUNK = 1 << 20
+HISTORY_SIZE = 10
+
+
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(CHECKSUM_CHUNK), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_artifact(path):
+    """joblib.load with numpy arrays memory-mapped when the file allows it"""
+    try:
+        return joblib.load(path, mmap_mode='r')
+    except ValueError:
+        # Compressed joblib files cannot be memory-mapped
+        return joblib.load(path)
+
+
+class ModelArtifacts:
+    """One loaded, warmed model + scaler pair; never mutated after creation"""
+
+    def __init__(self, model, scaler, scorer, checksums, fingerprint, evaluation=None):
+        self.model = model
+        self.scaler = scaler
+        self.scorer = scorer
+        self.checksums = checksums
+        self.fingerprint = fingerprint
+        self.evaluation = evaluation or {}
+        self.version = hashlib.sha256(''.join(checksums.values()).encode()).hexdigest()[:12]
+        self.loaded_at = datetime.now()
+
+    @property
+    def accuracy(self):
+        """Held-out accuracy in percent, or None if this model was not evaluated"""
+        accuracy = self.evaluation.get('accuracy')
+        return None if accuracy is None else accuracy * 100
+
+    def describe(self):
+        return {
+            'version': self.version,
+            'scorer': self.scorer.kind,
+            'scorer_fallback': self.scorer.fallback_reason,
+            'model': type(self.model).__name__,
+            'n_features': self.scorer.n_features,
+            'checksums': dict(self.checksums),
+            'evaluation': dict(self.evaluation),
+            'loaded_at': self.loaded_at.isoformat(),
+        }
+
+
+class ModelRegistry:
+    """
+    Serve the current ModelArtifacts for a model / scaler file pair.
+
+    get() is cheap: it stats the files at most every `interval` seconds and
+    only reloads once a change has stayed put for `settle` seconds (so a
+    model and scaler copied one after the other are picked up together).
+    A reload that fails leaves the previous artifacts in service.
+    """
+
+    def __init__(self, model_path, scaler_path, metrics_path=None, interval=1.0, settle=None):
+        self.paths = {'model': model_path, 'scaler': scaler_path}
+        self.metrics_path = metrics_path
+        self.settle = interval if settle is None else settle
+        watched = list(self.paths.values()) + ([metrics_path] if metrics_path else [])
+        self._files = FileVersion(watched, interval=interval)
+        self._current = None
+        self._lock = threading.Lock()
+        self._candidate = None
+        self._candidate_seen = 0.0
+        self._failed_fingerprint = None
+        self.last_error = None
+        self.reloads = 0
+        self.history = deque(maxlen=HISTORY_SIZE)
+
+    def get(self):
+        """Current artifacts, loading or hot-swapping them first if needed (None if unavailable)"""
+        current = self._current
+        fingerprint = self._files.current()
+        if current is not None and fingerprint == current.fingerprint:
+            return current
+        if current is not None and not self._settled(fingerprint):
+            return current
+        if fingerprint == self._failed_fingerprint:
+            return current
+
+        with self._lock:
+            if self._current is not None and self._current.fingerprint == fingerprint:
+                return self._current
+            self._reload(fingerprint)
+            return self._current
+
+    @property
+    def version(self):
+        return self._current.version if self._current is not None else None
+
+    def state(self):
+        current = self._current
+        return {
+            'loaded': current is not None,
+            'scorer': current.scorer.kind if current is not None else None,
+            'scorer_fallback': current.scorer.fallback_reason if current is not None else None,
+            'current': current.describe() if current is not None else None,
+            'reloads': self.reloads,
+            'last_error': self.last_error,
+            'history': list(self.history),
+        }
+
+    def _read_evaluation(self, model_checksum):
+        if not self.metrics_path:
+            return {}
+        try:
+            with open(self.metrics_path) as f:
+                evaluation = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if evaluation.get('model_sha256') != model_checksum:
+            logger.warning("Ignoring %s: it describes a different model", self.metrics_path)
+            return {}
+        return evaluation
+
+    def _settled(self, fingerprint):
+        now = time.monotonic()
+        if fingerprint != self._candidate:
+            self._candidate = fingerprint
+            self._candidate_seen = now
+        return now - self._candidate_seen >= self.settle
+
+    def _reload(self, fingerprint):
+        try:
+            checksums = {name: file_checksum(path) for name, path in self.paths.items()}
+            evaluation = self._read_evaluation(checksums['model'])
+            if self._current is not None and checksums == self._current.checksums:
+                # Touched but identical: keep the loaded objects
+                self._current = ModelArtifacts(self._current.model, self._current.scaler,
+                                               self._current.scorer, checksums, fingerprint, evaluation)
+                return
+
+            start = time.perf_counter()
+            model = load_artifact(self.paths['model'])
+            scaler = load_artifact(self.paths['scaler'])
+            scorer = compile_scorer(model, scaler)
+            # Warm-up: fault in mapped pages and fail here rather than on a request
+            score_features(scorer, encode_features([{}], scorer.n_features))
+            artifacts = ModelArtifacts(model, scaler, scorer, checksums, fingerprint, evaluation)
+        except Exception as e:
+            self._failed_fingerprint = fingerprint
+            self.last_error = f'{type(e).__name__}: {e}'
+            logger.error("Model load failed (%s); keeping version %s", self.last_error, self.version)
+            return
+
+        previous = self.version
+        self._current = artifacts
+        self._failed_fingerprint = None
+        self.last_error = None
+        self.reloads += 1
+        self.history.appendleft(dict(artifacts.describe(),
+                                     load_ms=round((time.perf_counter() - start) * 1000, 1)))
+        logger.info("Model version %s loaded (was %s) with the %s scorer",
+                    artifacts.version, previous, artifacts.scorer.kind)
+        if artifacts.scorer.fallback_reason:
+            logger.warning("Scoring through the sklearn fallback: %s", artifacts.scorer.fallback_reason)
@@ -1,4 +1,5 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects.postgresql import JSONB
 from datetime import datetime
 
 
@@ -28,7 +29,163 @@ class Simulation(db.Model):
     status = db.Column(db.String(20), nullable=False) 
     
     
-    date_added = db.Column(db.DateTime, default=datetime.now)
+    # Partition key of simulations on Postgres (monthly, see init.sql)
+    date_added = db.Column(db.DateTime, nullable=False, default=datetime.now)
 
     def __repr__(self):
-        return f'<Client {self.client_name}>'
\ No newline at end of file
+        return f'<Client {self.client_name}>'
+
+
+# Newest-first listings (/dashboard, /requests keyset pages)
+db.Index('idx_simulations_date_added', Simulation.date_added.desc(), Simulation.id.desc())
+# /requests filtered by status
+db.Index('idx_simulations_status_date', Simulation.status, Simulation.date_added.desc(), Simulation.id.desc())
+# /requests filtered on high risk (risk_score > 50)
+db.Index('idx_simulations_high_risk', Simulation.date_added.desc(), Simulation.id.desc(),
+         postgresql_where=Simulation.risk_score > 50, sqlite_where=Simulation.risk_score > 50)
+# Duplicate-CIN checks in the quality DAG
+db.Index('idx_simulations_cin', Simulation.cin)
+# Outlier recounts in the quality DAG (running_stats._count_outliers)
+db.Index('idx_simulations_annual_income', Simulation.annual_income)
+db.Index('idx_simulations_loan_amount', Simulation.loan_amount)
+db.Index('idx_simulations_credit_score', Simulation.credit_score)
+
+
+class SimulationCin(db.Model):
+
+    __tablename__ = 'simulation_cins'
+
+
+    # Every CIN present in simulations, once (see cins.py)
+    cin = db.Column(db.String(20), primary_key=True)
+
+    def __repr__(self):
+        return f'<Cin {self.cin}>'
+
+
+class StagingApplication(db.Model):
+
+    __tablename__ = 'staging_applications'
+    __table_args__ = (
+        db.Index('idx_staging_unprocessed', 'uploaded_at', 'id',
+                 postgresql_where=db.text('processed = FALSE'),
+                 sqlite_where=db.text('processed = 0')),
+        # Processed rows due for archiving (warehouse_maintenance)
+        db.Index('idx_staging_archivable', 'uploaded_at',
+                 postgresql_where=db.text('processed = TRUE'),
+                 sqlite_where=db.text('processed = 1')),
+    )
+
+
+    id = db.Column(db.Integer, primary_key=True)
+
+
+    client_name = db.Column(db.String(100))
+    cin = db.Column(db.String(20))
+    phone = db.Column(db.String(20))
+
+
+    annual_income = db.Column(db.Float)
+    debt_to_income_ratio = db.Column(db.Float)
+    credit_score = db.Column(db.Integer)
+    loan_amount = db.Column(db.Float)
+    loan_term = db.Column(db.Integer)
+    interest_rate = db.Column(db.Float)
+
+
+    gender = db.Column(db.String(20))
+    marital_status = db.Column(db.String(50))
+    education_level = db.Column(db.String(50))
+    employment_status = db.Column(db.String(50))
+    loan_purpose = db.Column(db.String(50))
+
+
+    processed = db.Column(db.Boolean, default=False)
+    uploaded_at = db.Column(db.DateTime, default=datetime.now)
+
+    def __repr__(self):
+        return f'<Staging {self.client_name}>'
+
+
+# /pipeline "recent uploads" list, answered from the index alone on Postgres
+db.Index('idx_staging_uploaded_at', StagingApplication.uploaded_at.desc(),
+         postgresql_include=['id', 'client_name', 'cin'])
+
+
+class KpiSummary(db.Model):
+
+    __tablename__ = 'kpi_summary'
+
+
+    id = db.Column(db.Integer, primary_key=True)
+
+
+    total_clients = db.Column(db.Integer, nullable=False, default=0)
+    high_risk_count = db.Column(db.Integer, nullable=False, default=0)
+    total_volume = db.Column(db.Float, nullable=False, default=0)
+
+
+    updated_at = db.Column(db.DateTime, default=datetime.now)
+
+    def __repr__(self):
+        return f'<KPI {self.total_clients}>'
+
+
+class ColumnStats(db.Model):
+
+    __tablename__ = 'column_stats'
+
+
+    column_name = db.Column(db.String(50), primary_key=True)
+
+
+    n = db.Column(db.BigInteger, nullable=False, default=0)
+    mean = db.Column(db.Float, nullable=False, default=0)
+    m2 = db.Column(db.Float, nullable=False, default=0)
+    min_value = db.Column(db.Float)
+    max_value = db.Column(db.Float)
+
+
+    null_count = db.Column(db.BigInteger, nullable=False, default=0)
+    outlier_count = db.Column(db.BigInteger, nullable=False, default=0)
+    duplicate_count = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+    watermark_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.now)
+
+    def __repr__(self):
+        return f'<Stats {self.column_name}>'
+
+
+class PipelineProgress(db.Model):
+
+    __tablename__ = 'pipeline_progress'
+
+
+    run_id = db.Column(db.String(250), primary_key=True)
+    dag_id = db.Column(db.String(250), nullable=False)
+
+
+    state = db.Column(db.String(20), nullable=False, default='running')
+    stage = db.Column(db.String(50))
+
+
+    rows_staged = db.Column(db.Integer, nullable=False, default=0)
+    rows_validated = db.Column(db.Integer, nullable=False, default=0)
+    rows_scored = db.Column(db.Integer, nullable=False, default=0)
+    rows_loaded = db.Column(db.Integer, nullable=False, default=0)
+    # jsonb on Postgres: report_progress merges it with jsonb operators
+    partition_counts = db.Column(db.JSON().with_variant(JSONB, 'postgresql'), nullable=False, default=dict)
+
+
+    error = db.Column(db.Text)
+    started_at = db.Column(db.DateTime, default=datetime.now)
+    updated_at = db.Column(db.DateTime, default=datetime.now)
+
+    def __repr__(self):
+        return f'<Progress {self.run_id} {self.state}>'
+
+
+# Most recent runs for the progress feed
+db.Index('idx_pipeline_progress_updated', PipelineProgress.updated_at.desc())
@@ -0,0 +1,118 @@
+-- One-off migration for a bank_warehouse created before simulations was
+-- partitioned (fresh databases get the partitioned layout from init.sql).
+-- Run with the web app and the DAGs stopped:
+--
+--     psql -U admin -d bank_warehouse -f partition_simulations.sql
+--
+-- Every existing row lands in simulations_default; the next
+-- warehouse_maintenance run moves them into their monthly partitions.
+-- It also adds the staging indexes from init.sql, which db.create_all()
+-- does not add to a table that already exists.
+
+BEGIN;
+
+ALTER TABLE simulations RENAME TO simulations_unpartitioned;
+ALTER TABLE simulations_unpartitioned RENAME CONSTRAINT simulations_pkey TO simulations_unpartitioned_pkey;
+DROP INDEX IF EXISTS idx_simulations_date_added;
+DROP INDEX IF EXISTS idx_simulations_status_date;
+DROP INDEX IF EXISTS idx_simulations_high_risk;
+DROP INDEX IF EXISTS idx_simulations_cin;
+DROP INDEX IF EXISTS idx_simulations_annual_income;
+DROP INDEX IF EXISTS idx_simulations_loan_amount;
+DROP INDEX IF EXISTS idx_simulations_credit_score;
+
+CREATE TABLE simulations (
+    id INTEGER NOT NULL DEFAULT nextval('simulations_id_seq'),
+    client_name VARCHAR(100),
+    cin VARCHAR(20),
+    phone VARCHAR(20),
+    annual_income FLOAT,
+    credit_score INTEGER,
+    loan_amount FLOAT,
+    loan_term INTEGER,
+    interest_rate FLOAT,
+    risk_score FLOAT,
+    status VARCHAR(20),
+    date_added TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, date_added)
+) PARTITION BY RANGE (date_added);
+
+CREATE TABLE simulations_default
+    PARTITION OF simulations DEFAULT;
+
+INSERT INTO simulations
+    (id, client_name, cin, phone, annual_income, credit_score, loan_amount,
+     loan_term, interest_rate, risk_score, status, date_added)
+SELECT id, client_name, cin, phone, annual_income, credit_score, loan_amount,
+       loan_term, interest_rate, risk_score, status, COALESCE(date_added, CURRENT_TIMESTAMP)
+FROM simulations_unpartitioned;
+
+ALTER SEQUENCE simulations_id_seq OWNED BY simulations.id;
+DROP TABLE simulations_unpartitioned;
+
+CREATE INDEX idx_simulations_date_added
+    ON simulations (date_added DESC, id DESC);
+CREATE INDEX idx_simulations_status_date
+    ON simulations (status, date_added DESC, id DESC);
+CREATE INDEX idx_simulations_high_risk
+    ON simulations (date_added DESC, id DESC)
+    WHERE risk_score > 50;
+CREATE INDEX idx_simulations_cin
+    ON simulations (cin);
+CREATE INDEX idx_simulations_annual_income
+    ON simulations (annual_income);
+CREATE INDEX idx_simulations_loan_amount
+    ON simulations (loan_amount);
+CREATE INDEX idx_simulations_credit_score
+    ON simulations (credit_score);
+
+-- Keyset pagination of the unprocessed backlog (extract_task)
+CREATE INDEX IF NOT EXISTS idx_staging_unprocessed
+    ON staging_applications (uploaded_at, id)
+    WHERE processed = FALSE;
+-- Processed rows due for archiving (warehouse_maintenance)
+CREATE INDEX IF NOT EXISTS idx_staging_archivable
+    ON staging_applications (uploaded_at)
+    WHERE processed = TRUE;
+-- /pipeline "recent uploads" list (covering)
+CREATE INDEX IF NOT EXISTS idx_staging_uploaded_at
+    ON staging_applications (uploaded_at DESC)
+    INCLUDE (id, client_name, cin);
+
+-- CINs already in simulations, for the batch DAG's history dedup
+CREATE TABLE IF NOT EXISTS simulation_cins (
+    cin VARCHAR(20) PRIMARY KEY
+);
+INSERT INTO simulation_cins (cin)
+SELECT DISTINCT cin FROM simulations WHERE cin IS NOT NULL
+ON CONFLICT (cin) DO NOTHING;
+
+CREATE TABLE IF NOT EXISTS staging_applications_archive (
+    id INTEGER PRIMARY KEY,
+    client_name VARCHAR(100),
+    cin VARCHAR(20),
+    phone VARCHAR(20),
+    annual_income FLOAT,
+    debt_to_income_ratio FLOAT,
+    credit_score INTEGER,
+    loan_amount FLOAT,
+    loan_term INTEGER,
+    interest_rate FLOAT,
+    gender VARCHAR(20),
+    marital_status VARCHAR(50),
+    education_level VARCHAR(50),
+    employment_status VARCHAR(50),
+    loan_purpose VARCHAR(50),
+    processed BOOLEAN,
+    uploaded_at TIMESTAMP,
+    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- pipeline_progress created by db.create_all() before partition_counts
+-- existed, or with it as json: report_progress needs jsonb
+ALTER TABLE IF EXISTS pipeline_progress
+    ADD COLUMN IF NOT EXISTS partition_counts JSONB NOT NULL DEFAULT '{}';
+ALTER TABLE IF EXISTS pipeline_progress
+    ALTER COLUMN partition_counts TYPE jsonb USING partition_counts::jsonb;
+
+COMMIT;
@@ -0,0 +1,225 @@
+"""
+NB BANK - Live batch pipeline progress
+The batch DAG records per-run counters (staged, validated, scored, loaded)
+in pipeline_progress and NOTIFYs PROGRESS_CHANNEL in the same transaction.
+
+Each web process keeps one ProgressFeed: a thread that LISTENs on its own
+connection, re-reads only the runs named in the notifications and fans the
+changes out to every open /api/pipeline/stream client. Open monitors cost
+no queries; the database sees one notification per state change. On
+databases without LISTEN (SQLite in development) the thread polls instead.
+"""
+
+import json
+import logging
+import queue
+import select
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import bindparam, text
+
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_CHANNEL = 'pipeline_progress'
+COUNTERS = ('rows_staged', 'rows_validated', 'rows_scored', 'rows_loaded')
+PROGRESS_COLUMNS = ('run_id', 'dag_id', 'state', 'stage') + COUNTERS + ('error', 'started_at', 'updated_at')
+
+HISTORY_SIZE = 10
+SUBSCRIBER_QUEUE_SIZE = 100
+KEEPALIVE_SECONDS = 15
+RECONNECT_DELAY = 5
+
+
+def report_progress(cursor, run_id, dag_id, state=None, stage=None, error=None, counts=None, increments=None,
+                    partition=None):
+    """
+    Upsert one run's progress and notify listeners (DB-API cursor on
+    Postgres; the notification is delivered when the caller commits).
+    `counts` set counters, `increments` add to them; other fields are only
+    changed when given.
+
+    With `partition` (a mapped task's index) the increments are recorded
+    for that partition and the counter is the sum over partitions, so a
+    retried task replaces its earlier report instead of adding to it.
+    """
+    counts = counts or {}
+    increments = increments or {}
+    params = {'run_id': run_id, 'dag_id': dag_id, 'state': state or 'running',
+              'stage': stage, 'error': error}
+    updates = ["state = COALESCE(%(new_state)s, pipeline_progress.state)",
+               "stage = COALESCE(%(stage)s, pipeline_progress.stage)",
+               "error = COALESCE(%(error)s, pipeline_progress.error)",
+               "updated_at = NOW()"]
+    params['new_state'] = state
+    params['partition'] = str(partition)
+    partition_counts = "pipeline_progress.partition_counts"
+    for name in COUNTERS:
+        params[name] = int(counts.get(name, increments.get(name, 0)))
+        if name in counts:
+            updates.append(f"{name} = %({name})s")
+            partition_counts = f"({partition_counts} - '{name}')"
+        elif name in increments and partition is not None:
+            per_partition = (f"(COALESCE(pipeline_progress.partition_counts -> '{name}', '{{}}'::jsonb)"
+                             f" || jsonb_build_object(%(partition)s, %({name})s))")
+            updates.append(f"{name} = (SELECT SUM(value::bigint) FROM jsonb_each_text({per_partition}))")
+            partition_counts = f"({partition_counts} || jsonb_build_object('{name}', {per_partition}))"
+        elif name in increments:
+            updates.append(f"{name} = pipeline_progress.{name} + %({name})s")
+    updates.append(f"partition_counts = {partition_counts}")
+    params['partition_counts'] = json.dumps(
+        {} if partition is None else {name: {str(partition): params[name]} for name in increments if name not in counts})
+
+    cursor.execute(f"""
+        INSERT INTO pipeline_progress
+            (run_id, dag_id, state, stage, error, {', '.join(COUNTERS)}, partition_counts, started_at, updated_at)
+        VALUES (%(run_id)s, %(dag_id)s, %(state)s, %(stage)s, %(error)s,
+                {', '.join(f'%({name})s' for name in COUNTERS)}, %(partition_counts)s, NOW(), NOW())
+        ON CONFLICT (run_id) DO UPDATE SET {', '.join(updates)}
+    """, params)
+    cursor.execute("SELECT pg_notify(%s, %s)", (PROGRESS_CHANNEL, run_id))
+
+
+def _row_to_dict(row):
+    return {key: value.isoformat() if isinstance(value, datetime) else value
+            for key, value in row._mapping.items()}
+
+
+class ProgressFeed:
+    """
+    In-process cache of the most recent runs plus the subscriber queues of
+    the open SSE streams. Started on first use in each (forked) worker.
+    """
+
+    def __init__(self, engine, poll_interval=2.0):
+        self.engine = engine
+        self.poll_interval = poll_interval
+        self._runs = {}
+        self._loaded = False
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def snapshot(self):
+        """Most recent runs, newest first (loaded from the database on first call only)"""
+        self._ensure_started()
+        if not self._loaded:
+            self._refresh()
+        with self._lock:
+            return sorted(self._runs.values(), key=lambda run: run['started_at'] or '', reverse=True)
+
+    def subscribe(self, max_streams):
+        """Queue receiving every changed run, or None when max_streams are already open"""
+        self._ensure_started()
+        with self._lock:
+            if len(self._subscribers) >= max_streams:
+                return None
+            subscriber = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+            self._subscribers.add(subscriber)
+            return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def is_subscribed(self, subscriber):
+        with self._lock:
+            return subscriber in self._subscribers
+
+    def events(self, subscriber, max_seconds):
+        """
+        Server-Sent Events for one client: the current snapshot, then one
+        event per changed run, with keep-alive comments in between. Ends
+        after max_seconds (the browser reconnects) or when the client falls
+        too far behind.
+        """
+        deadline = time.monotonic() + max_seconds
+        try:
+            yield f"retry: 3000\nevent: snapshot\ndata: {json.dumps(self.snapshot())}\n\n"
+            while time.monotonic() < deadline:
+                try:
+                    run = subscriber.get(timeout=KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    if not self.is_subscribed(subscriber):
+                        return
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: progress\ndata: {json.dumps(run)}\n\n"
+        finally:
+            self.unsubscribe(subscriber)
+
+    # -- background listener -------------------------------------------------
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='progress-feed', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                if self.engine.dialect.name == 'postgresql':
+                    self._listen()
+                else:
+                    self._poll()
+            except Exception as e:
+                logger.warning("Progress feed interrupted (%s); reconnecting in %ss", e, RECONNECT_DELAY)
+                time.sleep(RECONNECT_DELAY)
+
+    def _listen(self):
+        raw = self.engine.raw_connection()
+        # A dedicated connection: it stays out of the request pool and in autocommit
+        raw.detach()
+        try:
+            conn = raw.dbapi_connection
+            conn.rollback()
+            conn.autocommit = True
+            conn.cursor().execute(f"LISTEN {PROGRESS_CHANNEL}")
+            # Anything that changed while we were not listening
+            self._refresh()
+            while True:
+                if not select.select([conn], [], [], KEEPALIVE_SECONDS)[0]:
+                    continue
+                conn.poll()
+                run_ids = {notify.payload for notify in conn.notifies}
+                conn.notifies.clear()
+                if run_ids:
+                    self._refresh(run_ids)
+        finally:
+            raw.close()
+
+    def _poll(self):
+        while True:
+            self._refresh()
+            time.sleep(self.poll_interval)
+
+    def _refresh(self, run_ids=None):
+        columns = ', '.join(PROGRESS_COLUMNS)
+        if run_ids:
+            stmt = text(f"SELECT {columns} FROM pipeline_progress WHERE run_id IN :run_ids")
+            stmt = stmt.bindparams(bindparam('run_ids', value=list(run_ids), expanding=True))
+        else:
+            stmt = text(f"SELECT {columns} FROM pipeline_progress ORDER BY updated_at DESC LIMIT {HISTORY_SIZE}")
+        with self.engine.connect() as conn:
+            rows = [_row_to_dict(row) for row in conn.execute(stmt)]
+
+        with self._lock:
+            changed = [row for row in rows if self._runs.get(row['run_id']) != row]
+            for row in changed:
+                self._runs[row['run_id']] = row
+            for run_id in sorted(self._runs, key=lambda r: self._runs[r]['updated_at'] or '')[:-HISTORY_SIZE]:
+                del self._runs[run_id]
+            self._loaded = True
+            subscribers = list(self._subscribers)
+
+        for row in changed:
+            for subscriber in subscribers:
+                try:
+                    subscriber.put_nowait(row)
+                except queue.Full:
+                    # Too slow to keep up: its stream ends and the browser reconnects
+                    self.unsubscribe(subscriber)
@@ -0,0 +1,260 @@
+"""
+NB BANK - Persisted running statistics for simulations columns
+Welford / Chan mergeable moments, updated from the rows added since the
+last watermark so quality checks cost time proportional to new data.
+
+Ids are handed out at INSERT but become visible at COMMIT, so the
+watermark only moves up to the last id the sequence had handed out once
+every transaction writing to simulations that could still commit a lower
+id has ended.
+
+Outliers are recounted on every refresh against the current cutoffs (one
+range query per column on its index), so they match a full-table 3-sigma
+count. The other stats only ever grow: rows deleted later (keep_latest CIN
+dedup in the batch DAG) stay in the moments, null and duplicate-CIN counts
+until rebuild_stats() refolds the table.
+
+Works on a DB-API (psycopg2) cursor; callers own the transaction.
+"""
+
+import math
+import time
+
+
+NUMERIC_COLUMNS = ['annual_income', 'loan_amount', 'credit_score']
+TEXT_COLUMNS = ['client_name', 'cin']
+
+OUTLIER_SIGMAS = 3
+# Seconds refresh_stats waits for transactions that may hold unseen ids
+SETTLE_TIMEOUT = 120
+SETTLE_POLL_SECONDS = 1
+# Below this many observations the persisted cutoffs are not trusted
+MIN_HISTORY = 100
+
+
+def empty_moments():
+    return {'n': 0, 'mean': 0.0, 'm2': 0.0, 'min_value': None, 'max_value': None}
+
+
+def merge_moments(a, b):
+    """Combine two sets of moments (Chan et al. parallel update)"""
+    if b['n'] == 0:
+        return dict(a)
+    if a['n'] == 0:
+        return dict(b)
+    n = a['n'] + b['n']
+    delta = b['mean'] - a['mean']
+    return {
+        'n': n,
+        'mean': a['mean'] + delta * b['n'] / n,
+        'm2': a['m2'] + b['m2'] + delta * delta * a['n'] * b['n'] / n,
+        'min_value': min(a['min_value'], b['min_value']),
+        'max_value': max(a['max_value'], b['max_value']),
+    }
+
+
+def std(moments):
+    """Sample standard deviation (ddof=1, as pandas computes it)"""
+    if moments['n'] < 2:
+        return float('nan')
+    return math.sqrt(moments['m2'] / (moments['n'] - 1))
+
+
+def outlier_bounds(moments, sigmas=OUTLIER_SIGMAS, min_history=MIN_HISTORY):
+    """(low, high) cutoffs, or None when there is not enough history"""
+    if moments is None or moments['n'] < max(min_history, 2):
+        return None
+    spread = sigmas * std(moments)
+    return moments['mean'] - spread, moments['mean'] + spread
+
+
+def load_stats(cursor, columns=None):
+    """Read persisted stats as {column: row dict}"""
+    cursor.execute("""
+        SELECT column_name, n, mean, m2, min_value, max_value,
+               null_count, outlier_count, duplicate_count, watermark_id
+        FROM column_stats
+    """)
+    names = [d[0] for d in cursor.description]
+    stats = {row[0]: dict(zip(names, row)) for row in cursor.fetchall()}
+    if columns is not None:
+        stats = {col: stats[col] for col in columns if col in stats}
+    return stats
+
+
+def load_outlier_bounds(cursor, columns):
+    """{column: (low, high) or None} from the persisted moments"""
+    stats = load_stats(cursor, columns)
+    return {col: outlier_bounds(stats.get(col)) for col in columns}
+
+
+def _new_row_aggregates(cursor, low_id, high_id):
+    numeric = ', '.join(
+        f"COUNT({c}), AVG({c}), COALESCE(VAR_POP({c}) * COUNT({c}), 0), MIN({c}), MAX({c}), "
+        f"COUNT(*) - COUNT({c})"
+        for c in NUMERIC_COLUMNS
+    )
+    text = ', '.join(f"COUNT(*) FILTER (WHERE {c} IS NULL OR {c} = '')" for c in TEXT_COLUMNS)
+    cursor.execute(f"""
+        SELECT {numeric}, {text}
+        FROM simulations
+        WHERE id > %(low)s AND id <= %(high)s
+    """, {'low': low_id, 'high': high_id})
+    row = cursor.fetchone()
+
+    batch = {}
+    for i, col in enumerate(NUMERIC_COLUMNS):
+        n, mean, m2, lo, hi, nulls = row[i * 6:(i + 1) * 6]
+        moments = empty_moments() if not n else {
+            'n': n, 'mean': float(mean), 'm2': float(m2), 'min_value': float(lo), 'max_value': float(hi),
+        }
+        batch[col] = dict(moments, null_count=nulls)
+    offset = len(NUMERIC_COLUMNS) * 6
+    for i, col in enumerate(TEXT_COLUMNS):
+        batch[col] = dict(empty_moments(), null_count=row[offset + i])
+    return batch
+
+
+def _count_outliers(cursor, high_id, bounds):
+    """Rows up to high_id outside each column's cutoffs (uses idx_simulations_<column>)"""
+    counts = {}
+    for col in NUMERIC_COLUMNS:
+        if not bounds.get(col):
+            counts[col] = 0
+            continue
+        low, high = bounds[col]
+        cursor.execute(f"""
+            SELECT COUNT(*)
+            FROM simulations
+            WHERE id <= %(high_id)s AND ({col} < %(low)s OR {col} > %(high)s)
+        """, {'high_id': high_id, 'low': low, 'high': high})
+        counts[col] = cursor.fetchone()[0]
+    return counts
+
+
+def _count_new_duplicate_cins(cursor, low_id, high_id):
+    """CINs that reached a second occurrence within (low_id, high_id] (uses idx_simulations_cin)"""
+    if low_id == 0:
+        # First fold or rebuild: one aggregate over the table beats a lookup per CIN
+        cursor.execute("""
+            SELECT COUNT(*) FROM (
+                SELECT cin FROM simulations
+                WHERE id <= %(high)s AND cin IS NOT NULL
+                GROUP BY cin
+                HAVING COUNT(*) > 1
+            ) duplicated
+        """, {'high': high_id})
+        return cursor.fetchone()[0]
+    cursor.execute("""
+        WITH new_cins AS (
+            SELECT cin, COUNT(*) AS new_n
+            FROM simulations
+            WHERE id > %(low)s AND id <= %(high)s AND cin IS NOT NULL
+            GROUP BY cin
+        )
+        SELECT COUNT(*)
+        FROM new_cins n
+        CROSS JOIN LATERAL (
+            SELECT COUNT(*) AS total FROM simulations s WHERE s.cin = n.cin AND s.id <= %(high)s
+        ) t
+        WHERE t.total > 1 AND t.total - n.new_n <= 1
+    """, {'low': low_id, 'high': high_id})
+    return cursor.fetchone()[0]
+
+
+def _settled_high_id(cursor, timeout):
+    """
+    Last id handed out by the simulations sequence, returned once no
+    transaction that started before it was read still holds a write lock
+    on simulations (those are the only ones that can commit a lower id;
+    readers such as long exports are not waited for). None after
+    `timeout` seconds.
+    """
+    cursor.execute("""
+        SELECT COALESCE(last_value, 0)
+        FROM pg_sequences
+        WHERE format('%I.%I', schemaname, sequencename) = pg_get_serial_sequence('simulations', 'id')
+    """)
+    row = cursor.fetchone()
+    high_id = row[0] if row else 0
+    cursor.execute("SELECT clock_timestamp()")
+    read_at = cursor.fetchone()[0]
+
+    deadline = time.monotonic() + timeout
+    while True:
+        # pg_stat_activity is otherwise frozen for the rest of our transaction
+        cursor.execute("SELECT pg_stat_clear_snapshot()")
+        cursor.execute("""
+            SELECT COUNT(DISTINCT l.pid)
+            FROM pg_locks l
+            JOIN pg_stat_activity a ON a.pid = l.pid
+            WHERE l.locktype = 'relation'
+              AND l.relation = 'simulations'::regclass
+              AND l.mode = 'RowExclusiveLock'
+              AND l.pid <> pg_backend_pid()
+              AND a.xact_start < %s
+        """, (read_at,))
+        if cursor.fetchone()[0] == 0:
+            return high_id
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(SETTLE_POLL_SECONDS)
+
+
+def refresh_stats(cursor, settle_timeout=SETTLE_TIMEOUT):
+    """
+    Fold rows added since the watermark into column_stats and return the
+    updated stats. Outliers are recounted over the table against the merged
+    cutoffs; CINs are counted once, when they first become duplicated.
+    The watermark stays put when in-flight inserts do not settle within
+    `settle_timeout` seconds; the next run picks those rows up.
+    """
+    stats = load_stats(cursor)
+    watermark = min((s['watermark_id'] for s in stats.values()), default=0) if stats else 0
+
+    high_id = _settled_high_id(cursor, settle_timeout)
+    if high_id is None or high_id <= watermark:
+        return stats
+
+    batch = _new_row_aggregates(cursor, watermark, high_id)
+
+    merged = {}
+    for col in NUMERIC_COLUMNS + TEXT_COLUMNS:
+        previous = stats.get(col) or dict(empty_moments(), null_count=0, outlier_count=0, duplicate_count=0)
+        moments = merge_moments(previous, batch[col])
+        merged[col] = dict(moments,
+                           column_name=col,
+                           null_count=previous['null_count'] + batch[col]['null_count'],
+                           outlier_count=previous['outlier_count'],
+                           duplicate_count=previous['duplicate_count'],
+                           watermark_id=high_id)
+
+    # Same rule as the former full-table check: mean +- 3 sigma, whatever the history
+    outliers = _count_outliers(cursor, high_id,
+                               {col: outlier_bounds(merged[col], min_history=2) for col in NUMERIC_COLUMNS})
+    for col, count in outliers.items():
+        merged[col]['outlier_count'] = count
+    merged['cin']['duplicate_count'] += _count_new_duplicate_cins(cursor, watermark, high_id)
+
+    for row in merged.values():
+        cursor.execute("""
+            INSERT INTO column_stats
+                (column_name, n, mean, m2, min_value, max_value,
+                 null_count, outlier_count, duplicate_count, watermark_id, updated_at)
+            VALUES (%(column_name)s, %(n)s, %(mean)s, %(m2)s, %(min_value)s, %(max_value)s,
+                    %(null_count)s, %(outlier_count)s, %(duplicate_count)s, %(watermark_id)s, NOW())
+            ON CONFLICT (column_name) DO UPDATE SET
+                n = EXCLUDED.n, mean = EXCLUDED.mean, m2 = EXCLUDED.m2,
+                min_value = EXCLUDED.min_value, max_value = EXCLUDED.max_value,
+                null_count = EXCLUDED.null_count, outlier_count = EXCLUDED.outlier_count,
+                duplicate_count = EXCLUDED.duplicate_count, watermark_id = EXCLUDED.watermark_id,
+                updated_at = EXCLUDED.updated_at
+        """, row)
+
+    return merged
+
+
+def rebuild_stats(cursor, settle_timeout=SETTLE_TIMEOUT):
+    """Drop the persisted stats and refold the whole table (one full scan)"""
+    cursor.execute("DELETE FROM column_stats")
+    return refresh_stats(cursor, settle_timeout)
@@ -0,0 +1,155 @@
+"""
+NB BANK - Compiled scorers for the loan model
+Folds the StandardScaler into a logistic model so scoring is one dot product
+
+Run `python scorer.py` to check parity against predict_proba and print a
+single-row / batch latency microbenchmark.
+"""
+
+import time
+
+import numpy as np
+from sklearn.linear_model import LogisticRegression
+from sklearn.preprocessing import StandardScaler
+
+
+PARITY_TOLERANCE = 1e-9
+
+
+class SklearnScorer:
+    """Fallback: scaler.transform + model.predict_proba"""
+
+    kind = 'sklearn'
+
+    def __init__(self, model, scaler, fallback_reason=None):
+        self.model = model
+        self.scaler = scaler
+        self.n_features = scaler.n_features_in_
+        # Why compile_scorer could not use a faster scorer
+        self.fallback_reason = fallback_reason
+
+    def prepare(self, features):
+        """Scale encoded features into model input"""
+        return self.scaler.transform(features)
+
+    def predict_prepared(self, X):
+        return self.model.predict_proba(X)[:, 1]
+
+    def predict_paid_proba(self, features):
+        """Probability of the 'paid' class (column 1) for each row"""
+        return self.predict_prepared(self.prepare(features))
+
+
+class LinearScorer:
+    """Pure NumPy logistic scorer with the scaler folded into the weights"""
+
+    kind = 'linear'
+    fallback_reason = None
+
+    def __init__(self, weights, intercept):
+        self.weights = weights
+        self.intercept = intercept
+        self.n_features = len(weights)
+
+    def prepare(self, features):
+        # Scaling is folded into the weights
+        return features
+
+    def predict_prepared(self, X):
+        z = X @ self.weights + self.intercept
+        return 0.5 * (1.0 + np.tanh(0.5 * z))
+
+    def predict_paid_proba(self, features):
+        return self.predict_prepared(features)
+
+
+def _fold_linear(model, scaler):
+    """Return a LinearScorer for scaler + binary LogisticRegression, else None"""
+    if not isinstance(model, LogisticRegression) or not isinstance(scaler, StandardScaler):
+        return None
+    if len(model.classes_) != 2 or getattr(model, 'multi_class', 'auto') == 'multinomial':
+        return None
+
+    n_features = scaler.n_features_in_
+    mean = scaler.mean_ if scaler.with_mean else np.zeros(n_features)
+    scale = scaler.scale_ if scaler.with_std else np.ones(n_features)
+
+    coef = model.coef_[0]
+    weights = coef / scale
+    intercept = float(model.intercept_[0] - np.dot(coef, mean / scale))
+    return LinearScorer(weights, intercept)
+
+
+def check_parity(scorer, model, scaler, features):
+    """Largest absolute difference between the scorer and predict_proba"""
+    expected = model.predict_proba(scaler.transform(features))[:, 1]
+    return float(np.max(np.abs(scorer.predict_paid_proba(features) - expected)))
+
+
+def compile_scorer(model, scaler):
+    """
+    Build the fastest scorer that reproduces model.predict_proba(scaler.transform(X)).
+
+    Linear models are folded into a LinearScorer; anything else (or a fold that
+    fails the parity probe) falls back to SklearnScorer, which records why.
+    """
+    scorer = _fold_linear(model, scaler)
+    if scorer is None:
+        return SklearnScorer(model, scaler, f"{type(model).__name__} is not a foldable linear model")
+    probe = np.random.default_rng(0).normal(scale=100.0, size=(8, scorer.n_features))
+    diff = check_parity(scorer, model, scaler, probe)
+    if diff > PARITY_TOLERANCE:
+        return SklearnScorer(model, scaler, f"linear fold failed the parity probe (max diff {diff:.1e})")
+    return scorer
+
+
+def _time_call(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return np.median(timings) * 1e6
+
+
+def benchmark(scorer, model, scaler, batch_size=10000, repeat=200):
+    """Median latency in microseconds for one row and for `batch_size` rows"""
+    rng = np.random.default_rng(1)
+    single = rng.normal(size=(1, scorer.n_features))
+    batch = rng.normal(size=(batch_size, scorer.n_features))
+
+    return {
+        'kind': scorer.kind,
+        'single_us': _time_call(lambda: scorer.predict_paid_proba(single), repeat),
+        'single_sklearn_us': _time_call(lambda: model.predict_proba(scaler.transform(single)), repeat),
+        'batch_us': _time_call(lambda: scorer.predict_paid_proba(batch), max(repeat // 20, 3)),
+        'batch_sklearn_us': _time_call(lambda: model.predict_proba(scaler.transform(batch)), max(repeat // 20, 3)),
+        'batch_size': batch_size,
+    }
+
+
+def _report(name, scorer, model, scaler, features):
+    diff = check_parity(scorer, model, scaler, features)
+    assert diff <= PARITY_TOLERANCE, f"{name}: parity failed (max diff {diff:.3e})"
+    bench = benchmark(scorer, model, scaler)
+    print(f"{name} [{bench['kind']}] parity max diff {diff:.2e}")
+    print(f"   single row : {bench['single_us']:9.1f} us   (sklearn {bench['single_sklearn_us']:9.1f} us)")
+    print(f"   batch {bench['batch_size']:<5}: {bench['batch_us']:9.1f} us   (sklearn {bench['batch_sklearn_us']:9.1f} us)")
+
+
+if __name__ == '__main__':
+    import os
+    import joblib
+
+    rng = np.random.default_rng(42)
+    X = rng.normal(loc=50, scale=20, size=(2000, 54))
+    y = (X[:, 0] - X[:, 2] + rng.normal(scale=10, size=2000) > 0).astype(int)
+    lr_scaler = StandardScaler().fit(X)
+    lr_model = LogisticRegression(max_iter=1000).fit(lr_scaler.transform(X), y)
+    _report('LogisticRegression', compile_scorer(lr_model, lr_scaler), lr_model, lr_scaler, X)
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    model = joblib.load(os.path.join(base_dir, 'loan_prediction_model.pkl'))
+    scaler = joblib.load(os.path.join(base_dir, 'data_scaler.pkl'))
+    _report(type(model).__name__, compile_scorer(model, scaler), model, scaler,
+            rng.normal(size=(500, scaler.n_features_in_)) * scaler.scale_ + scaler.mean_)
@@ -94,24 +94,41 @@ function initializeRiskTrendChart() {
 
 
 function updateSystemMetrics() {
-    
-    const cpu = 35 + Math.random() * 15;
-    updateMetric('cpuUsage', 'cpuBar', cpu);
-    
-    
-    const ram = 60 + Math.random() * 15;
-    updateMetric('ramUsage', 'ramBar', ram);
-    
-    
-    const storage = 50 + Math.random() * 10;
-    updateMetric('storageUsage', 'storageBar', storage);
+    fetch('/api/metrics')
+        .then(response => response.json())
+        .then(data => {
+            updateMetric('cpuUsage', 'cpuBar', data.system.cpu);
+            updateMetric('ramUsage', 'ramBar', data.system.ram);
+            updateMetric('storageUsage', 'storageBar', data.system.storage);
+
+            const predict = data.endpoints.predict;
+            const latency = document.getElementById('avgLatency');
+            if (latency) {
+                const value = predict && predict.avg_ms !== null ? Math.round(predict.avg_ms) : '—';
+                latency.innerHTML = `${value}<span>ms</span>`;
+            }
+
+            const stages = document.getElementById('latencyStages');
+            if (stages && predict) {
+                stages.textContent = Object.entries(predict.stages)
+                    .map(([name, stage]) => `${name} ${stage.avg_ms.toFixed(2)}ms`)
+                    .join(' · ');
+            }
+        })
+        .catch(error => console.error('Metrics error:', error));
 }
 
 function updateMetric(labelId, barId, value) {
-    const rounded = Math.round(value);
     const label = document.getElementById(labelId);
     const bar = document.getElementById(barId);
     
+    if (value === null || value === undefined) {
+        if (label) label.textContent = '—';
+        if (bar) bar.style.width = '0%';
+        return;
+    }
+    
+    const rounded = Math.round(value);
     if (label) label.textContent = rounded + '%';
     if (bar) bar.style.width = rounded + '%';
 }
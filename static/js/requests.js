@@ -3,33 +3,6 @@
 let currentClientData = null;
 
 
-function filterTable() {
-    const input = document.getElementById('searchInput');
-    const filter = input.value.toUpperCase();
-    const table = document.getElementById('clientsTable');
-    const rows = table.getElementsByTagName('tr');
-    
-    for (let i = 1; i < rows.length; i++) {
-        const row = rows[i];
-        const cells = row.getElementsByTagName('td');
-        let found = false;
-        
-        for (let j = 0; j < cells.length; j++) {
-            const cell = cells[j];
-            if (cell) {
-                const text = cell.textContent || cell.innerText;
-                if (text.toUpperCase().indexOf(filter) > -1) {
-                    found = true;
-                    break;
-                }
-            }
-        }
-        
-        row.style.display = found ? '' : 'none';
-    }
-}
-
-
 function showClientModal(clientId, clientData) {
     currentClientData = clientData;
     const modal = new bootstrap.Modal(document.getElementById('clientModal'));
@@ -184,25 +157,106 @@ function downloadPDF() {
 }
 
 
+function escapeHtml(value) {
+    return String(value ?? '').replace(/[&<>"']/g, ch => ({
+        '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'
+    })[ch]);
+}
+
+
+function renderClientRow(c) {
+    const riskClass = c.risk_score > 50 ? 'high' : (c.risk_score > 30 ? 'medium' : 'low');
+    const statusBadge = c.status === 'Approved'
+        ? '<span class="status-badge approved"><i class="bi bi-check-circle-fill"></i> Approuvé</span>'
+        : '<span class="status-badge rejected"><i class="bi bi-x-circle-fill"></i> Refusé</span>';
+
+    const row = document.createElement('tr');
+    row.innerHTML = `
+        <td>
+            <div class="client-cell">
+                <div class="client-avatar">${escapeHtml((c.client_name || '')[0])}</div>
+                <div>
+                    <div class="client-name">${escapeHtml(c.client_name)}</div>
+                    <div class="client-id">ID: #${c.id}</div>
+                </div>
+            </div>
+        </td>
+        <td class="text-secondary">${escapeHtml(c.cin)}</td>
+        <td class="text-secondary">${escapeHtml(c.phone || 'N/A')}</td>
+        <td><strong>${Math.round(c.loan_amount || 0).toLocaleString('en-US')} MAD</strong></td>
+        <td><div class="risk-badge ${riskClass}">${c.risk_score}%</div></td>
+        <td>${statusBadge}</td>
+        <td class="text-muted">${new Date(c.date_added).toLocaleDateString('fr-FR')}</td>
+        <td>
+            <button class="btn-view show-client-btn">
+                <i class="bi bi-eye"></i> Détails
+            </button>
+        </td>
+    `;
+    row.querySelector('.show-client-btn').clientData = {
+        ...c,
+        phone: c.phone || 'N/A',
+        annual_income: c.annual_income || 0,
+        credit_score: c.credit_score || 0,
+        loan_amount: c.loan_amount || 0,
+        loan_term: c.loan_term || 0,
+        interest_rate: c.interest_rate || 0,
+        risk_score: c.risk_score || 0
+    };
+    return row;
+}
+
+
+function clientDataFromButton(btn) {
+    if (btn.clientData) return btn.clientData;
+    const d = btn.dataset;
+    return {
+        id: parseInt(d.id) || 0,
+        client_name: d.clientName || '',
+        cin: d.cin || '',
+        phone: d.phone || 'N/A',
+        annual_income: parseFloat(d.annualIncome) || 0,
+        credit_score: parseInt(d.creditScore) || 0,
+        loan_amount: parseFloat(d.loanAmount) || 0,
+        loan_term: parseInt(d.loanTerm) || 0,
+        interest_rate: parseFloat(d.interestRate) || 0,
+        risk_score: parseFloat(d.riskScore) || 0,
+        status: d.status || '',
+        date_added: d.dateAdded || ''
+    };
+}
+
+
+async function loadMoreClients() {
+    const btn = document.getElementById('loadMoreBtn');
+    const params = new URLSearchParams({ cursor: btn.dataset.nextCursor });
+    if (btn.dataset.status) params.set('status', btn.dataset.status);
+    if (btn.dataset.risk) params.set('risk', btn.dataset.risk);
+    if (btn.dataset.search) params.set('q', btn.dataset.search);
+
+    btn.disabled = true;
+    try {
+        const response = await fetch(`/api/requests?${params}`);
+        const page = await response.json();
+        const body = document.getElementById('clientsBody');
+        page.items.forEach(c => body.appendChild(renderClientRow(c)));
+
+        btn.dataset.nextCursor = page.next_cursor || '';
+        btn.style.display = page.next_cursor ? '' : 'none';
+    } finally {
+        btn.disabled = false;
+    }
+}
+
+
 document.addEventListener('DOMContentLoaded', function () {
-    document.querySelectorAll('.show-client-btn').forEach(function (btn) {
-        btn.addEventListener('click', function () {
-            const d = btn.dataset;
-            const clientData = {
-                id: parseInt(d.id) || 0,
-                client_name: d.clientName || '',
-                cin: d.cin || '',
-                phone: d.phone || 'N/A',
-                annual_income: parseFloat(d.annualIncome) || 0,
-                credit_score: parseInt(d.creditScore) || 0,
-                loan_amount: parseFloat(d.loanAmount) || 0,
-                loan_term: parseInt(d.loanTerm) || 0,
-                interest_rate: parseFloat(d.interestRate) || 0,
-                risk_score: parseFloat(d.riskScore) || 0,
-                status: d.status || '',
-                date_added: d.dateAdded || ''
-            };
-            showClientModal(clientData.id, clientData);
-        });
+    document.getElementById('clientsBody').addEventListener('click', function (event) {
+        const btn = event.target.closest('.show-client-btn');
+        if (!btn) return;
+        const clientData = clientDataFromButton(btn);
+        showClientModal(clientData.id, clientData);
     });
-});
\ No newline at end of file
+
+    const loadMore = document.getElementById('loadMoreBtn');
+    if (loadMore) loadMore.addEventListener('click', loadMoreClients);
+});
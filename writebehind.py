@@ -0,0 +1,254 @@
+"""
+NB BANK - Write-behind persistence of simulations
+/predict answers as soon as the application is scored; its row goes to a
+bounded in-process queue that a background thread writes in batches.
+
+When the queue is full, callers wait (up to a timeout) for the writer to
+catch up. Batches that cannot be written (database down) are appended to a
+JSON-lines spool file and fsynced, then replayed once the database is back;
+spools left behind by other or earlier worker processes are replayed too.
+Queued rows are flushed at interpreter exit.
+"""
+
+import atexit
+import fcntl
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindFull(Exception):
+    """The queue stayed full for the whole put timeout"""
+
+
+def _encode(row):
+    return json.dumps({key: value.isoformat() if isinstance(value, datetime) else value
+                       for key, value in row.items()})
+
+
+class WriteBehindWriter:
+    """
+    Queue rows and hand them to `flush(rows)` from a daemon thread, at most
+    `batch_size` at a time, waiting up to `interval` seconds for a batch to
+    fill. `flush` must write the rows in one transaction or raise.
+    """
+
+    def __init__(self, flush, spool_dir, maxsize=10000, batch_size=500, interval=0.2,
+                 retry_delay=5.0, datetime_fields=(), name='write-behind'):
+        self.flush = flush
+        self.spool_dir = spool_dir
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.interval = interval
+        self.retry_delay = retry_delay
+        self.datetime_fields = datetime_fields
+        self.name = name
+
+        self._queue = deque()
+        self._in_flight = 0
+        self._spool_pending = False
+        self._retry_at = 0.0
+        self._counters = {'queued': 0, 'written': 0, 'batches': 0, 'spooled': 0, 'replayed': 0,
+                          'rejected': 0, 'failed_flushes': 0}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+
+    def put(self, rows, timeout=None):
+        """Queue rows, waiting up to `timeout` seconds for room (raises WriteBehindFull)"""
+        rows = list(rows)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            if self._stopping:
+                raise RuntimeError(f'{self.name} is closed')
+            self._ensure_worker()
+            # A batch larger than the whole queue is let in once the queue is empty
+            while self._queue and len(self._queue) + len(rows) > self.maxsize:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self._counters['rejected'] += len(rows)
+                    raise WriteBehindFull(f'{self.name} queue is full ({len(self._queue)} rows waiting)')
+                self._cond.wait(remaining)
+            self._queue.extend(rows)
+            self._counters['queued'] += len(rows)
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return dict(self._counters, pending=len(self._queue), in_flight=self._in_flight,
+                        spool_pending=self._spool_pending, maxsize=self.maxsize)
+
+    def drain(self, timeout=None):
+        """Wait until every queued row is written or spooled"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._cond.notify_all()
+            while self._queue or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout=10):
+        """Write (or spool) what is queued, then stop the writer (used at shutdown)"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None and thread.is_alive():
+            thread.join(timeout)
+
+    def _ensure_worker(self):
+        # Also restarts the thread in forked worker processes
+        if self._thread is None or not self._thread.is_alive():
+            self._spool_pending = bool(self._spool_files())
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def _next_batch(self):
+        """
+        The next rows to write; [] when only the spool is due for a retry,
+        None once stopping with nothing left
+        """
+        with self._cond:
+            while not self._queue:
+                if self._stopping:
+                    return None
+                if not self._spool_pending:
+                    self._cond.wait()
+                    continue
+                remaining = self._retry_at - time.monotonic()
+                if remaining <= 0:
+                    return []
+                self._cond.wait(remaining)
+
+            deadline = time.monotonic() + self.interval
+            while len(self._queue) < self.batch_size and not self._stopping:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = [self._queue.popleft() for _ in range(min(len(self._queue), self.batch_size))]
+            self._in_flight = len(batch)
+            # Room in the queue for waiting callers
+            self._cond.notify_all()
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            if self._spool_pending and time.monotonic() >= self._retry_at:
+                self._replay()
+            if batch:
+                self._write(batch)
+            with self._cond:
+                self._in_flight = 0
+                self._cond.notify_all()
+
+    def _write(self, batch):
+        # While older rows wait in the spool, newer ones queue up behind them
+        if not self._spool_pending:
+            try:
+                self.flush(batch)
+            except Exception as e:
+                logger.warning("%s: writing %d rows failed (%s); spooling to %s",
+                               self.name, len(batch), e, self.spool_dir)
+                self._counters['failed_flushes'] += 1
+                self._retry_at = time.monotonic() + self.retry_delay
+            else:
+                self._count(written=len(batch), batches=1)
+                return
+        try:
+            self._spool(batch)
+        except OSError:
+            logger.exception("%s: could not spool %d rows; they are lost", self.name, len(batch))
+
+    # -- spool ---------------------------------------------------------------
+
+    def _spool_files(self):
+        return sorted(path for path in glob.glob(os.path.join(self.spool_dir, '*.jsonl'))
+                      if os.path.getsize(path))
+
+    def _spool(self, rows):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        path = os.path.join(self.spool_dir, f'{self.name}-{os.getpid()}.jsonl')
+        while True:
+            with open(path, 'a') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                # Replayed and removed by another process while we waited for the lock
+                if os.fstat(f.fileno()).st_nlink == 0:
+                    continue
+                f.write(''.join(_encode(row) + '\n' for row in rows))
+                f.flush()
+                os.fsync(f.fileno())
+                break
+        self._spool_pending = True
+        self._count(spooled=len(rows))
+
+    def _replay(self):
+        """Write every spool file back in batches; a file is removed once fully written"""
+        done = True
+        for path in self._spool_files():
+            with open(path, 'r+') as f:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # Another process is replaying or appending to it
+                    done = False
+                    continue
+                rows = [json.loads(line) for line in f if line.strip()]
+                for row in rows:
+                    for field in self.datetime_fields:
+                        if row.get(field):
+                            row[field] = datetime.fromisoformat(row[field])
+
+                written = 0
+                try:
+                    for start in range(0, len(rows), self.batch_size):
+                        self.flush(rows[start:start + self.batch_size])
+                        written = min(start + self.batch_size, len(rows))
+                except Exception as e:
+                    logger.warning("%s: replaying %s failed (%s); retrying in %ss",
+                                   self.name, path, e, self.retry_delay)
+                    done = False
+
+                if written == len(rows):
+                    os.remove(path)
+                elif written:
+                    f.seek(0)
+                    f.truncate()
+                    f.write(''.join(_encode(row) + '\n' for row in rows[written:]))
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._count(replayed=written)
+            if not done:
+                break
+
+        self._spool_pending = not done
+        if not done:
+            self._retry_at = time.monotonic() + self.retry_delay
+
+    def _count(self, **amounts):
+        with self._cond:
+            for name, amount in amounts.items():
+                self._counters[name] += amount
+
+
+def create_write_behind(flush, spool_dir, maxsize, batch_size, interval, retry_delay,
+                        datetime_fields=(), name='write-behind'):
+    """Build a writer that flushes its queue at interpreter exit"""
+    writer = WriteBehindWriter(flush, spool_dir, maxsize=maxsize, batch_size=batch_size, interval=interval,
+                               retry_delay=retry_delay, datetime_fields=datetime_fields, name=name)
+    atexit.register(writer.close)
+    return writer